@@ -0,0 +1,235 @@
+"""
+Admission control for LLM calls.
+
+Ollama on a CPU box serves concurrent generations by time-slicing them,
+so twenty parses at once each take about twenty times as long and every
+client times out together. An AdmissionLimiter lets max_concurrent calls
+run, queues up to max_queue more in arrival order, and refuses the rest:
+
+- a caller that finds the queue full is rejected at once,
+- a queued caller that has not started within queue_timeout seconds is
+  rejected then,
+
+both with Overloaded, which app.py turns into 503 + Retry-After. The
+Retry-After estimate is the queue ahead of a new caller divided by
+max_concurrent, times the recent average call duration.
+
+Threads (slot()) and coroutines on the async server (aslot()) share the
+same slots and queue.
+"""
+import asyncio
+import collections
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import metrics
+
+QUEUE_DEPTH = metrics.REGISTRY.register(metrics.Gauge(
+    "notes_admission_queue_depth",
+    "Calls waiting for a slot.",
+    ("limiter",),
+))
+IN_FLIGHT = metrics.REGISTRY.register(metrics.Gauge(
+    "notes_admission_in_flight",
+    "Calls holding a slot.",
+    ("limiter",),
+))
+WAIT_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "notes_admission_wait_seconds",
+    "Time admitted calls spent waiting for a slot.",
+    ("limiter",),
+))
+REJECTED = metrics.REGISTRY.register(metrics.Counter(
+    "notes_admission_rejected_total",
+    "Calls refused, by reason (queue_full or timeout).",
+    ("limiter", "reason"),
+))
+
+
+class Overloaded(Exception):
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """
+    A queued caller. release() hands its slot straight to the first
+    waiter (granted=True) and wakes it: a thread through `event`, a
+    coroutine through `future` on its event loop.
+    """
+
+    __slots__ = ("granted", "event", "loop", "future")
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionLimiter:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int,
+                 queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queue = collections.deque()  # of _Waiter, in arrival order
+        self._avg_seconds = 1.0  # moving average of call durations
+        self._admitted = 0
+        self._rejected = 0
+
+    # ---------- slots ----------
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold a slot for the duration of the block.
+        """
+        self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """
+        slot() for coroutines: waiting for a slot does not block the
+        event loop.
+        """
+        await self.aacquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def acquire(self):
+        start = time.monotonic()
+        waiter = self._enqueue(None)
+        if waiter is None:
+            return
+        if not waiter.event.wait(self.queue_timeout):
+            self._give_up(waiter, "timeout")
+        self._waited(time.monotonic() - start)
+
+    async def aacquire(self):
+        start = time.monotonic()
+        waiter = self._enqueue(asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future),
+                                   self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._give_up(waiter, "timeout")
+        except asyncio.CancelledError:
+            # The request went away while queued.
+            self._give_up(waiter, None)
+            raise
+        self._waited(time.monotonic() - start)
+
+    def release(self, held_seconds: Optional[float] = None):
+        with self._lock:
+            if held_seconds is not None:
+                self._avg_seconds += 0.2 * (held_seconds - self._avg_seconds)
+            if self._queue:
+                waiter = self._queue.popleft()
+                waiter.granted = True
+                QUEUE_DEPTH.set(len(self._queue), limiter=self.name)
+                waiter.wake()
+            else:
+                self._active -= 1
+                IN_FLIGHT.set(self._active, limiter=self.name)
+
+    def _enqueue(self, loop) -> Optional[_Waiter]:
+        """
+        Take a free slot (returns None) or join the queue.
+        """
+        with self._lock:
+            if self._active < self.max_concurrent and not self._queue:
+                self._active += 1
+                self._admitted += 1
+                IN_FLIGHT.set(self._active, limiter=self.name)
+                WAIT_SECONDS.observe(0.0, limiter=self.name)
+                return None
+            if len(self._queue) >= self.max_queue:
+                self._reject("queue_full")
+            waiter = _Waiter(loop)
+            self._queue.append(waiter)
+            QUEUE_DEPTH.set(len(self._queue), limiter=self.name)
+            return waiter
+
+    def _give_up(self, waiter: _Waiter, reason: Optional[str]):
+        """
+        Leave the queue after a timeout (reason) or cancellation (None).
+        A slot granted in the meantime is kept on timeout and passed on
+        when cancelled.
+        """
+        with self._lock:
+            if not waiter.granted:
+                self._queue.remove(waiter)
+                QUEUE_DEPTH.set(len(self._queue), limiter=self.name)
+                if reason is not None:
+                    self._reject(reason)
+                return
+        if reason is None:
+            self.release()
+
+    def _waited(self, seconds: float):
+        with self._lock:
+            self._admitted += 1
+        WAIT_SECONDS.observe(seconds, limiter=self.name)
+
+    def _reject(self, reason: str):
+        self._rejected += 1
+        REJECTED.inc(limiter=self.name, reason=reason)
+        raise Overloaded(
+            f"{self.name} is at capacity ({reason.replace('_', ' ')})",
+            retry_after=self.retry_after(),
+        )
+
+    # ---------- reporting ----------
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a new caller could expect to start (called with the
+        lock held, or approximately without).
+        """
+        rounds = (len(self._queue) + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._avg_seconds))
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "in_flight": self._active,
+                "queued": len(self._queue),
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "avg_call_seconds": round(self._avg_seconds, 3),
+            }
@@ -1,31 +1,162 @@
+import base64
+import binascii
+import io
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
+from pydantic import ValidationError
+from sqlalchemy import event, tuple_
+from sqlalchemy.orm import load_only
 
-from models import db, User, Note
-from llm_agent import parse_user_query
+import models
+from models import (
+    db,
+    User,
+    Note,
+    apply_fts_search,
+    begin_write_transaction,
+    bump_notes_version,
+    configure_sqlite,
+    detect_search_index,
+    fts_match_expression,
+    get_notes_version,
+)
+from migrations import run_migrations
+import metrics
+from metrics import phase
+from semantic_index import SemanticIndex, create_embedder
+from topic_index import TopicIndex, fold_topic
+from admission import Overloaded
+from passwords import HashingBusy, hash_password, upgrade_hash, verify_password
+import llm_agent
+from llm_agent import (
+    NoteAction,
+    parse_cache,
+    parse_user_query_with_source,
+    stream_user_query_with_source,
+    warm_backend_in_background,
+)
 
 app = Flask(__name__)
 CORS(app)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-db_path = os.path.join(BASE_DIR, "notes.db")
+db_path = os.environ.get("NOTES_DB_PATH", os.path.join(BASE_DIR, "notes.db"))
 
 app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SECRET_KEY"] = "cs5200-secret-key"
 
+# ----------------- SQLite tuning -----------------
+# Applied to every new connection (see models.configure_sqlite). WAL lets
+# readers proceed while a writer commits; busy_timeout makes writers wait
+# for the lock instead of failing with "database is locked".
+app.config["SQLITE_PRAGMAS"] = {
+    "journal_mode": os.environ.get("NOTES_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("NOTES_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("NOTES_SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.environ.get("NOTES_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative cache_size is in KiB: -65536 = 64 MiB per connection.
+    "cache_size": int(os.environ.get("NOTES_SQLITE_CACHE_SIZE", "-65536")),
+}
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": int(os.environ.get("NOTES_DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.environ.get("NOTES_DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": float(os.environ.get("NOTES_DB_POOL_TIMEOUT", "30")),
+    "pool_pre_ping": False,
+    "connect_args": {"check_same_thread": False},
+}
+
 db.init_app(app)
 
+# When the server is started as `python app.py`, multiprocessing imports
+# this file again, as __mp_main__, in each password-hashing worker (see
+# passwords.py). The workers only hash, so they skip the start-up work:
+# migrations, the LLM warm-up and the index threads.
+HASH_WORKER = __name__ == "__mp_main__"
+
 # ----------------- DB init -----------------
-with app.app_context():
-    db.create_all()
+if not HASH_WORKER:
+    with app.app_context():
+        configure_sqlite(db.engine, app.config["SQLITE_PRAGMAS"])
+        db.create_all()
+        run_migrations()
+        detect_search_index()
+
+# The parser backend (LangChain, the Ollama client) is built on the first
+# NL request; by default a background thread does it right after startup
+# instead. NOTES_LLM_WARMUP=0 leaves it to the first request.
+if not HASH_WORKER and os.environ.get("NOTES_LLM_WARMUP", "1") != "0":
+    warm_backend_in_background()
+
+
+# ============ Request metrics ============
+
+@app.before_request
+def _start_request_metrics():
+    preparsed = request.environ.get(PREPARSED_ENVIRON_KEY)
+    metrics.start_request(preparsed.started if preparsed else None)
+
+
+@app.after_request
+def _finish_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    return metrics.finish_request(response, endpoint)
+
+
+def _collect_parse_cache_metrics():
+    stats = parse_cache.stats()
+    for name in ("memory_hits", "disk_hits", "misses", "stores", "evictions"):
+        PARSE_CACHE_EVENTS.set_total(stats[name], event=name)
+    PARSE_CACHE_ENTRIES.set(stats["memory_entries"], tier="memory")
+    if "disk_entries" in stats:
+        PARSE_CACHE_ENTRIES.set(stats["disk_entries"], tier="disk")
+
+
+PARSE_CACHE_EVENTS = metrics.REGISTRY.register(metrics.Counter(
+    "notes_parse_cache_events_total",
+    "Parse cache lookups and writes, by event.",
+    ("event",),
+))
+PARSE_CACHE_ENTRIES = metrics.REGISTRY.register(metrics.Gauge(
+    "notes_parse_cache_entries",
+    "Entries held in each parse cache tier.",
+    ("tier",),
+))
+metrics.REGISTRY.add_collector(_collect_parse_cache_metrics)
+
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(
+        metrics.REGISTRY.render(),
+        mimetype="text/plain; version=0.0.4",
+    )
 
 
 # ============ Auth endpoints ============
+# Hashing runs in passwords.py's process pool; when that is saturated the
+# request is refused rather than queued behind a login storm.
+
+@app.errorhandler(HashingBusy)
+def _hashing_busy(e):
+    response = jsonify({"error": "too many login attempts in progress, retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+@app.errorhandler(Overloaded)
+def _overloaded(e):
+    response = jsonify({"error": f"{e} - retry shortly", "retry_after": e.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
 
 @app.route("/api/register", methods=["POST"])
 def register():
@@ -39,7 +170,7 @@ def register():
     if User.query.filter_by(username=username).first():
         return jsonify({"error": "username already exists"}), 400
 
-    hashed_pw = generate_password_hash(password)
+    hashed_pw = hash_password(password)
     user = User(username=username, password=hashed_pw)
     db.session.add(user)
     db.session.commit()
@@ -57,9 +188,13 @@ def login():
         return jsonify({"error": "username and password required"}), 400
 
     user = User.query.filter_by(username=username).first()
-    if not user or not check_password_hash(user.password, password):
+    if not user or not verify_password(user.password, password):
         return jsonify({"error": "invalid credentials"}), 401
 
+    # Hash method or cost changed since this password was stored.
+    new_hash = upgrade_hash(user.password, password)
+    if new_hash:
+        user.password = new_hash
     user.last_login = datetime.utcnow()
     db.session.commit()
 
@@ -88,21 +223,310 @@ def forgot_password():
         return jsonify({"error": "user not found"}), 404
 
     # Check if new password is the same as the current one
-    if check_password_hash(user.password, new_password):
+    if verify_password(user.password, new_password):
         return jsonify(
             {"error": "new password cannot be the same as your current (old) password"}
         ), 400
 
     # Update password
-    user.password = generate_password_hash(new_password)
+    user.password = hash_password(new_password)
     db.session.commit()
 
     return jsonify({"message": "password reset successfully"}), 200
 
 
+# ============ Helper: keyset pagination ============
+# Note listings are ordered by (last_update DESC, note_id DESC). A cursor
+# encodes the sort key of the last note on a page, and the next page starts
+# strictly after it, so pages stay consistent while notes are edited.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def clamp_page_size(limit) -> int:
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    if limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(note: Note) -> str:
+    raw = json.dumps([note.last_update.isoformat(), note.note_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    """
+    Returns (last_update, note_id) or raises ValueError for a malformed cursor.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        last_update, note_id = json.loads(raw)
+        return datetime.fromisoformat(last_update), int(note_id)
+    except (binascii.Error, TypeError, ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def keyset_page_query(query, limit: int, cursor=None):
+    """
+    Restrict a Note query to the page after cursor, fetching one extra row
+    so the caller can tell whether another page exists.
+    Raises ValueError for a malformed cursor.
+    """
+    if cursor:
+        last_update, note_id = decode_cursor(cursor)
+        query = query.filter(
+            tuple_(Note.last_update, Note.note_id) < tuple_(last_update, note_id)
+        )
+    return query.order_by(Note.last_update.desc(), Note.note_id.desc()).limit(
+        limit + 1
+    )
+
+
+def paginate_notes(query, limit=None, cursor=None):
+    """
+    Apply keyset pagination to a Note query.
+    Returns (notes, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for a malformed cursor.
+    """
+    limit = clamp_page_size(limit)
+    notes = keyset_page_query(query, limit, cursor).all()
+    if len(notes) > limit:
+        return notes[:limit], encode_cursor(notes[limit - 1])
+    return notes, None
+
+
+# ============ Helper: field projection ============
+# `fields=note_id,topic` loads and returns only those note columns, e.g. for
+# pickers that do not need message bodies. note_id and last_update are
+# always loaded (not necessarily returned) because cursors are built from
+# them.
+
+def parse_fields(value):
+    """
+    Parse a fields projection given as "note_id,topic" or a list of names.
+    Returns a tuple in Note.FIELDS order, or None for all fields.
+    Raises ValueError for unknown fields.
+    """
+    if value is None or value == "":
+        return None
+    names = value.split(",") if isinstance(value, str) else value
+    if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+        raise ValueError("fields must be a comma-separated list of field names.")
+    requested = {n.strip() for n in names if n.strip()}
+    unknown = requested - set(Note.FIELDS)
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(sorted(unknown))}. "
+            f"Choose from: {', '.join(Note.FIELDS)}."
+        )
+    return tuple(f for f in Note.FIELDS if f in requested) or None
+
+
+def project_notes(query, fields):
+    """
+    Restrict a Note query to the columns needed for fields.
+    """
+    if fields is None:
+        return query
+    needed = set(fields) | {"note_id", "last_update"}
+    return query.options(load_only(*(getattr(Note, f) for f in needed)))
+
+
+# ============ Note indexes ============
+# semantic_index.py (note embeddings) and topic_index.py (topic trigrams)
+# follow note writes: perform_action queues each change on the session and
+# the indexes apply them only after the commit, so rolled-back writes never
+# reach them. notes_version tells them when a user's entry is stale for any
+# other reason (bulk import, another process) and must be rebuilt.
+
+semantic_index = SemanticIndex(
+    create_embedder(os.environ.get("NOTES_EMBEDDER", "hashing")),
+    # Kept next to the database by default (notes.db -> notes.semantic.npz),
+    # so an app opened on another NOTES_DB_PATH never overwrites it. Set
+    # NOTES_SEMANTIC_INDEX_PATH="" to keep the index in memory only.
+    path=None if HASH_WORKER else os.environ.get(
+        "NOTES_SEMANTIC_INDEX_PATH", os.path.splitext(db_path)[0] + ".semantic.npz"
+    ) or None,
+    source=os.path.abspath(db_path),
+)
+semantic_index.start_autosave(
+    float(os.environ.get("NOTES_SEMANTIC_SAVE_INTERVAL", "300"))
+)
+# Below this cosine similarity a note is not shown as a similar match.
+SEMANTIC_MIN_SCORE = float(os.environ.get("NOTES_SEMANTIC_MIN_SCORE", "0.3"))
+
+
+topic_index = TopicIndex()
+# Only a note whose topic equals or contains the requested one is acted on
+# (what the old ILIKE lookup matched), and it must beat the next such note
+# by TOPIC_AMBIGUITY_MARGIN. Looser matches scoring at least
+# TOPIC_MIN_SCORE are only offered as candidates.
+TOPIC_MIN_SCORE = float(os.environ.get("NOTES_TOPIC_MIN_SCORE", "0.3"))
+TOPIC_AMBIGUITY_MARGIN = float(os.environ.get("NOTES_TOPIC_AMBIGUITY_MARGIN", "0.1"))
+
+
+def _queue_note_change(*change):
+    db.session.info.setdefault("note_changes", []).append(change)
+
+
+@event.listens_for(db.session, "after_commit")
+def _apply_note_changes(session):
+    changes = session.info.pop("note_changes", None)
+    if changes:
+        semantic_index.apply(changes)
+        topic_index.apply(changes)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_note_changes(session):
+    session.info.pop("note_changes", None)
+
+
+def ensure_semantic_index(user_id: int) -> bool:
+    """
+    Make sure the user's vectors match their notes, re-embedding them if
+    notes_version moved on. Returns False if the user does not exist.
+    """
+    version = get_notes_version(user_id)
+    if version is None:
+        return False
+    if semantic_index.version(user_id) != version:
+        rows = (
+            db.session.query(Note.note_id, Note.topic, Note.message)
+            .filter_by(user_id=user_id)
+            .yield_per(2000)
+        )
+        semantic_index.rebuild_user(user_id, version, rows)
+    return True
+
+
+def semantic_search(user_id: int, queries, k: int, fields=None,
+                    min_score: float = SEMANTIC_MIN_SCORE):
+    """
+    For each query, the user's k most similar notes scoring at least
+    min_score, as to_dict(fields) plus "score", best first.
+    """
+    if not ensure_semantic_index(user_id):
+        return [[] for _ in queries]
+    matches = [
+        [(note_id, score) for note_id, score in hits if score >= min_score]
+        for hits in semantic_index.search(user_id, list(queries), k)
+    ]
+    note_ids = {note_id for hits in matches for note_id, _ in hits}
+    notes = {}
+    if note_ids:
+        query = Note.query.filter(
+            Note.user_id == user_id, Note.note_id.in_(note_ids)
+        )
+        notes = {n.note_id: n for n in project_notes(query, fields)}
+    return [
+        [
+            dict(notes[note_id].to_dict(fields), score=round(score, 4))
+            for note_id, score in hits
+            if note_id in notes
+        ]
+        for hits in matches
+    ]
+
+
+def ensure_topic_index(user_id: int):
+    version = get_notes_version(user_id)
+    if version is not None and topic_index.version(user_id) != version:
+        rows = (
+            db.session.query(Note.note_id, Note.topic)
+            .filter_by(user_id=user_id)
+            .yield_per(5000)
+        )
+        topic_index.rebuild_user(user_id, version, rows)
+
+
+def resolve_topic(user_id: int, topic: str):
+    """
+    Find the note update/delete-by-topic should act on.
+    Returns (note_id, candidates). note_id is set only for a literal
+    match; otherwise candidates (note_id, score), best first, are the
+    notes that match about equally well, or the fuzzy matches when no
+    topic contains the requested one, or empty when nothing is close.
+    """
+    ensure_topic_index(user_id)
+    ranked = topic_index.resolve(user_id, topic)
+    literal = [(note_id, score) for note_id, score, kind in ranked if kind]
+    if not literal:
+        return None, [
+            (note_id, score) for note_id, score, _ in ranked
+            if score >= TOPIC_MIN_SCORE
+        ]
+    exact = [note_id for note_id, _, kind in ranked if kind == "exact"]
+    if len(exact) == 1:
+        return exact[0], literal
+    # Several notes with the same topic, or several containing it.
+    if len(literal) > 1 and (
+        exact or literal[0][1] - literal[1][1] < TOPIC_AMBIGUITY_MARGIN
+    ):
+        return None, literal
+    return literal[0][0], literal
+
+
+def _ambiguous_topic_result(user_id: int, topic: str, candidates) -> dict:
+    """
+    Error listing candidates: either several notes match topic, or none
+    does literally and these are the closest ones.
+    """
+    notes = {
+        n.note_id: n
+        for n in project_notes(
+            Note.query.filter(
+                Note.user_id == user_id,
+                Note.note_id.in_([note_id for note_id, _ in candidates]),
+            ),
+            ("note_id", "topic"),
+        )
+    }
+    close = [
+        {"note_id": note_id, "topic": notes[note_id].topic, "score": round(score, 4)}
+        for note_id, score in candidates
+        if note_id in notes
+    ]
+    folded = fold_topic(topic)
+    if any(folded in fold_topic(c["topic"]) for c in close):
+        error = f'Several notes match "{topic}"; say which one by note id.'
+    else:
+        error = (f'No note about "{topic}" found; did you mean one of these? '
+                 "Say which one by note id.")
+    return {"error": error, "candidates": close}
+
+
+def _similar_notes_result(user_id: int, text: str, limit, fields):
+    """
+    Read fallback when nothing matches text literally.
+    """
+    notes = semantic_search(user_id, [text], clamp_page_size(limit), fields)[0]
+    if not notes:
+        return {"message": "No matching notes found."}
+    return {"message": "No exact matches; showing similar notes.", "notes": notes}
+
+
 # ============ Helper: perform CRUD based on NoteAction ============
 
-def perform_action(user_id: int, action_obj):
+def _save(commit: bool):
+    """
+    Commit the current write, or only flush it when the caller is
+    batching several actions into one transaction.
+    """
+    if commit:
+        with phase("commit"):
+            db.session.commit()
+    else:
+        db.session.flush()
+
+
+def perform_action(user_id: int, action_obj, limit=None, cursor=None, commit=True,
+                   fields=None):
     """
     Handles NoteAction from the LLM.
     Supports fields like:
@@ -111,8 +535,13 @@ def perform_action(user_id: int, action_obj):
       - message / new_message
       - note_id
       - search_query
+    list/read results are paged: limit caps the page size and cursor is the
+    next_cursor returned with the previous page, and fields (a parse_fields
+    tuple) limits the columns loaded and returned for each note.
+    With commit=False writes are only flushed; the caller commits.
     """
     action = getattr(action_obj, "action", None)
+    metrics.note_action(action)
 
     topic = (
         getattr(action_obj, "topic", None)
@@ -124,6 +553,12 @@ def perform_action(user_id: int, action_obj):
     )
     note_id = getattr(action_obj, "note_id", None)
     search_query = getattr(action_obj, "search_query", None)
+    # update/delete look notes up by their current topic and only rename
+    # to an explicitly new one.
+    target_topic = getattr(action_obj, "target_topic", None) or topic
+    new_topic = getattr(action_obj, "topic", None) or getattr(
+        action_obj, "new_topic", None
+    )
 
     # CREATE
     if action == "create":
@@ -137,72 +572,117 @@ def perform_action(user_id: int, action_obj):
             last_update=datetime.utcnow(),
         )
         db.session.add(note)
-        db.session.commit()
+        bump_notes_version(user_id)
+        db.session.flush()
+        _queue_note_change("upsert", user_id, note.note_id, topic, message)
+        _save(commit)
         return {"message": "Note created", "note": note.to_dict()}
 
     # LIST
     if action == "list":
-        notes = Note.query.filter_by(
-            user_id=user_id).order_by(Note.last_update.desc())
-        return {"notes": [n.to_dict() for n in notes]}
+        try:
+            notes, next_cursor = paginate_notes(
+                project_notes(Note.query.filter_by(user_id=user_id), fields),
+                limit,
+                cursor,
+            )
+        except ValueError as e:
+            return {"error": str(e)}
+        return {
+            "notes": [n.to_dict(fields) for n in notes],
+            "next_cursor": next_cursor,
+        }
 
     # READ
     if action == "read":
-        query = Note.query.filter_by(user_id=user_id)
+        query = project_notes(Note.query.filter_by(user_id=user_id), fields)
         if note_id is not None:
             query = query.filter_by(note_id=note_id)
         if topic:
             query = query.filter(Note.topic.ilike(f"%{topic}%"))
+
+        match_expression = (
+            fts_match_expression(search_query)
+            if search_query and models.fts_enabled
+            else None
+        )
+        if match_expression:
+            # Ranked results: return the best `limit` matches, no cursor.
+            rows = (
+                apply_fts_search(query, match_expression)
+                .limit(clamp_page_size(limit))
+                .all()
+            )
+            if not rows:
+                return _similar_notes_result(user_id, search_query, limit, fields)
+            return {
+                "notes": [
+                    dict(n.to_dict(fields), snippet=snippet) for n, snippet in rows
+                ]
+            }
+
         if search_query:
             like = f"%{search_query}%"
             query = query.filter(
                 (Note.topic.ilike(like)) | (Note.message.ilike(like))
             )
 
-        notes = query.order_by(Note.last_update.desc()).all()
+        try:
+            notes, next_cursor = paginate_notes(query, limit, cursor)
+        except ValueError as e:
+            return {"error": str(e)}
         if not notes:
+            if note_id is None and not cursor and (search_query or topic):
+                return _similar_notes_result(
+                    user_id, search_query or topic, limit, fields)
             return {"message": "No matching notes found."}
-        return {"notes": [n.to_dict() for n in notes]}
+        return {
+            "notes": [n.to_dict(fields) for n in notes],
+            "next_cursor": next_cursor,
+        }
 
     # UPDATE
     if action == "update":
-        query = Note.query.filter_by(user_id=user_id)
-        if note_id is not None:
-            query = query.filter_by(note_id=note_id)
-        elif topic:
-            query = query.filter(Note.topic.ilike(f"%{topic}%"))
-        else:
+        if note_id is None and target_topic:
+            note_id, candidates = resolve_topic(user_id, target_topic)
+            if note_id is None and candidates:
+                return _ambiguous_topic_result(user_id, target_topic, candidates)
+        elif note_id is None:
             return {"error": "Specify note_id or topic to update."}
 
-        note = query.first()
+        note = Note.query.filter_by(user_id=user_id, note_id=note_id).first()
         if not note:
             return {"error": "Note not found."}
 
         if message:
             note.message = message
-        if topic and topic != note.topic:
-            note.topic = topic
+        if new_topic and new_topic != note.topic:
+            note.topic = new_topic
 
         note.last_update = datetime.utcnow()
-        db.session.commit()
+        bump_notes_version(user_id)
+        _queue_note_change(
+            "upsert", user_id, note.note_id, note.topic, note.message)
+        _save(commit)
         return {"message": "Note updated", "note": note.to_dict()}
 
     # DELETE
     if action == "delete":
-        query = Note.query.filter_by(user_id=user_id)
-        if note_id is not None:
-            query = query.filter_by(note_id=note_id)
-        elif topic:
-            query = query.filter(Note.topic.ilike(f"%{topic}%"))
-        else:
+        if note_id is None and target_topic:
+            note_id, candidates = resolve_topic(user_id, target_topic)
+            if note_id is None and candidates:
+                return _ambiguous_topic_result(user_id, target_topic, candidates)
+        elif note_id is None:
             return {"error": "Specify note_id or topic to delete."}
 
-        note = query.first()
+        note = Note.query.filter_by(user_id=user_id, note_id=note_id).first()
         if not note:
             return {"error": "Note not found."}
 
         db.session.delete(note)
-        db.session.commit()
+        bump_notes_version(user_id)
+        _queue_note_change("delete", user_id, note.note_id)
+        _save(commit)
         return {"message": "Note deleted", "deleted_note_id": note.note_id}
 
     # HELP
@@ -220,33 +700,401 @@ def perform_action(user_id: int, action_obj):
     return {"error": f"Unknown action: {action}"}
 
 
+def perform_actions(user_id: int, actions, limit=None, cursor=None, commit=True,
+                    fields=None):
+    """
+    Run the actions parsed from one request as a unit: if one fails, the
+    writes made by the ones before it are rolled back and the rest are
+    skipped.
+    Returns (results, failed_index); failed_index is None on success.
+    """
+    if len(actions) == 1:
+        result = perform_action(user_id, actions[0], limit, cursor, commit, fields)
+        return [result], (0 if "error" in result else None)
+
+    begin_write_transaction()
+    savepoint = db.session.begin_nested()
+    queued = len(db.session.info.get("note_changes", ()))
+    results = []
+    for index, action_obj in enumerate(actions):
+        result = perform_action(
+            user_id, action_obj, limit, cursor, commit=False, fields=fields)
+        results.append(result)
+        if "error" not in result:
+            continue
+
+        savepoint.rollback()
+        # A savepoint rollback fires no session event; drop its changes here.
+        del db.session.info.get("note_changes", [])[queued:]
+        if commit:
+            db.session.rollback()
+        for earlier in results[:index]:
+            if "note" in earlier or "deleted_note_id" in earlier:
+                earlier["rolled_back"] = True
+        results.extend(
+            {"error": f"Skipped because action {index + 1} failed."}
+            for _ in actions[index + 1:]
+        )
+        return results, index
+
+    savepoint.commit()
+    if commit:
+        with phase("commit"):
+            db.session.commit()
+    return results, None
+
+
+def actions_payload(actions, parse_source, results, failed_index) -> dict:
+    """
+    Response body for parsed actions and their results. "parsed_action" and
+    "result" describe the single action of a one-action request (as before
+    multi-action parsing); for several actions "result" is a summary and the
+    per-action details are in "parsed_actions" / "results".
+    """
+    payload = {
+        "parsed_action": actions[0].model_dump(),
+        "parsed_actions": [a.model_dump() for a in actions],
+        "parse_source": parse_source,
+        "results": results,
+    }
+    if len(actions) == 1:
+        payload["result"] = results[0]
+    elif failed_index is not None:
+        payload["result"] = {
+            "error": (
+                f"Action {failed_index + 1} of {len(actions)} failed: "
+                f"{results[failed_index]['error']} No changes were saved."
+            )
+        }
+    else:
+        payload["result"] = {"message": f"Completed {len(actions)} actions."}
+    return payload
+
+
+# The async server (asgi.py) awaits the parse of an /api/nl_query body
+# itself and hands the outcome to the Flask view in the WSGI environ, so
+# a worker thread is only held for the database work.
+PREPARSED_ENVIRON_KEY = "notes.preparsed"
+
+
+class PreParsed:
+    def __init__(self, query: str, started: float, seconds: float,
+                 actions=None, parse_source=None, error=None):
+        self.query = query
+        self.started = started  # perf_counter() when the request arrived
+        self.seconds = seconds
+        self.actions = actions
+        self.parse_source = parse_source
+        self.error = error
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.actions, self.parse_source
+
+
+def parse_with_metrics(user_input: str):
+    """
+    parse_user_query_with_source, timed as the "parse" phase and counted by
+    parse source. Uses the async server's parse when there is one.
+    """
+    preparsed = request.environ.get(PREPARSED_ENVIRON_KEY)
+    if preparsed is not None and preparsed.query == user_input:
+        metrics.add_phase("parse", preparsed.seconds)
+        actions, parse_source = preparsed.result()
+    else:
+        with phase("parse"):
+            actions, parse_source = parse_user_query_with_source(user_input)
+    metrics.PARSES.inc(source=parse_source)
+    return actions, parse_source
+
+
 # ============ Natural language endpoint ============
 
+def parse_nl_request(data):
+    """
+    Check an /api/nl_query (or /stream) body before anything is parsed,
+    so a request that can only end in a 400 never costs an LLM call.
+    Returns (user_id, query, fields) or raises ValueError.
+    """
+    if not isinstance(data, dict) or not data.get("user_id"):
+        raise ValueError("user_id required (login first).")
+    user_input = data.get("query")
+    if not isinstance(user_input, str) or not user_input:
+        raise ValueError("query text required.")
+    fields = parse_fields(data.get("fields"))
+    limit = data.get("limit")
+    if limit is not None:
+        try:
+            int(limit)
+        except (TypeError, ValueError):
+            raise ValueError("limit must be an integer.") from None
+    cursor = data.get("cursor")
+    if cursor:
+        if not isinstance(cursor, str):
+            raise ValueError("Invalid cursor.")
+        decode_cursor(cursor)
+    return data["user_id"], user_input, fields
+
+
 @app.route("/api/nl_query", methods=["POST"])
 def nl_query():
+    data = request.get_json() or {}
+    try:
+        user_id, user_input, fields = parse_nl_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        actions, parse_source = parse_with_metrics(user_input)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({"error": f"LLM parsing failed: {str(e)}"}), 500
+
+    with phase("db"):
+        results, failed_index = perform_actions(
+            user_id,
+            actions,
+            limit=data.get("limit"),
+            cursor=data.get("cursor"),
+            fields=fields,
+        )
+    with phase("serialize"):
+        return jsonify(actions_payload(actions, parse_source, results, failed_index))
+
+
+# ============ Batch natural language endpoint ============
+# Queries in a batch are parsed concurrently on a shared, bounded pool so
+# a batch costs roughly one LLM round trip per NL_BATCH_WORKERS queries.
+# Once all of them are parsed, they are applied in order in a single,
+# short transaction.
+
+NL_BATCH_WORKERS = int(os.environ.get("NL_BATCH_WORKERS", "4"))
+NL_BATCH_MAX_QUERIES = int(os.environ.get("NL_BATCH_MAX_QUERIES", "100"))
+
+parse_pool = ThreadPoolExecutor(
+    max_workers=NL_BATCH_WORKERS, thread_name_prefix="nl-parse"
+)
+
+
+@app.route("/api/nl_query/batch", methods=["POST"])
+def nl_query_batch():
+    """
+    Body: {"user_id": 1, "queries": ["...", "..."]}
+    Returns one result per query, in order. A query that fails to parse
+    gets an "error" item and does not stop the others.
+    """
     data = request.get_json() or {}
     user_id = data.get("user_id")
-    user_input = data.get("query", "")
+    queries = data.get("queries")
 
     if not user_id:
         return jsonify({"error": "user_id required (login first)."}), 400
-    if not user_input:
-        return jsonify({"error": "query text required."}), 400
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "queries must be a non-empty list."}), 400
+    if len(queries) > NL_BATCH_MAX_QUERIES:
+        return jsonify(
+            {"error": f"at most {NL_BATCH_MAX_QUERIES} queries per batch."}
+        ), 400
+    if not all(isinstance(q, str) and q.strip() for q in queries):
+        return jsonify({"error": "every query must be non-empty text."}), 400
+
+    futures = [parse_pool.submit(parse_user_query_with_source, q) for q in queries]
 
+    # Every parse finishes before the database is touched, so the write
+    # transaction below is never held across an LLM round trip.
+    parsed = []  # (query, actions, parse_source) or (query, None, error item)
+    with phase("parse"):
+        for query, future in zip(queries, futures):
+            try:
+                actions, parse_source = future.result()
+            except Overloaded as e:
+                parsed.append((query, None, {
+                    "query": query, "error": str(e), "retry_after": e.retry_after}))
+                continue
+            except Exception as e:
+                parsed.append((query, None, {
+                    "query": query, "error": f"LLM parsing failed: {str(e)}"}))
+                continue
+            metrics.PARSES.inc(source=parse_source)
+            parsed.append((query, actions, parse_source))
+
+    items = []
     try:
-        action_obj = parse_user_query(user_input)
+        with phase("db"):
+            begin_write_transaction()
+        for query, actions, outcome in parsed:
+            if actions is None:
+                items.append(outcome)
+                continue
+            with phase("db"):
+                results, failed_index = perform_actions(
+                    user_id, actions, commit=False)
+            items.append(
+                dict(
+                    actions_payload(actions, outcome, results, failed_index),
+                    query=query,
+                )
+            )
+        with phase("commit"):
+            db.session.commit()
     except Exception as e:
-        return jsonify({"error": f"LLM parsing failed: {str(e)}"}), 500
+        db.session.rollback()
+        return jsonify({"error": f"Batch failed and was rolled back: {str(e)}"}), 500
 
-    result = perform_action(user_id, action_obj)
-    return jsonify(
+    with phase("serialize"):
+        return jsonify({"results": items})
+
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/api/nl_query/stream", methods=["POST"])
+def nl_query_stream():
+    """
+    Same input as /api/nl_query, answered as Server-Sent Events:
+      parse_started -> token* -> parsed_action -> result -> done
+    or an `error` event in place of the remaining ones.
+    """
+    data = request.get_json() or {}
+    try:
+        user_id, user_input, fields = parse_nl_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def events():
+        yield _sse_event("parse_started", {})
+        try:
+            for kind, payload in stream_user_query_with_source(user_input):
+                if kind == "token":
+                    yield _sse_event("token", {"text": payload})
+                else:
+                    actions, parse_source = payload
+        except Overloaded as e:
+            # Headers are already sent, so this is an event, not a 503.
+            yield _sse_event(
+                "error", {"error": str(e), "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            yield _sse_event("error", {"error": f"LLM parsing failed: {str(e)}"})
+            return
+        metrics.PARSES.inc(source=parse_source)
+
+        yield _sse_event(
+            "parsed_action",
+            {
+                "parsed_action": actions[0].model_dump(),
+                "parsed_actions": [a.model_dump() for a in actions],
+                "parse_source": parse_source,
+            },
+        )
+        results, failed_index = perform_actions(
+            user_id,
+            actions,
+            limit=data.get("limit"),
+            cursor=data.get("cursor"),
+            fields=fields,
+        )
+        payload = actions_payload(actions, parse_source, results, failed_index)
+        yield _sse_event(
+            "result", {"result": payload["result"], "results": payload["results"]}
+        )
+        yield _sse_event("done", {})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/parse_cache/stats", methods=["GET"])
+def parse_cache_stats():
+    return jsonify(parse_cache.stats())
+
+
+@app.route("/api/llm/status", methods=["GET"])
+def llm_status():
+    """
+    Parser backend health: for Ollama, whether the model is loaded, the
+    last probe and warm-up, and cold/warm parse counts; plus the LLM
+    admission queue.
+    """
+    status = llm_agent.backend.status()
+    status["admission"] = llm_agent.llm_slots.status()
+    return jsonify(status)
+
+
+# ============ Structured notes endpoints (no LLM) ============
+
+def _action_response(action_kwargs: dict, user_id, success_status: int = 200):
+    """
+    Validate a NoteAction built from a REST request and run it through
+    perform_action, mapping its error results to HTTP status codes.
+    """
+    if not user_id:
+        return jsonify({"error": "user_id required"}), 400
+
+    try:
+        action_obj = NoteAction(**action_kwargs)
+    except ValidationError as e:
+        return jsonify({"error": f"Invalid note data: {e.errors()[0]['msg']}"}), 400
+
+    with phase("db"):
+        result = perform_action(user_id, action_obj)
+    status = success_status
+    if "error" in result:
+        status = 404 if result["error"] == "Note not found." else 400
+    with phase("serialize"):
+        return jsonify(result), status
+
+
+@app.route("/api/notes", methods=["POST"])
+def create_note():
+    data = request.get_json() or {}
+    topic = data.get("topic")
+    message = data.get("message")
+
+    if not topic or not message:
+        return jsonify({"error": "topic and message are required"}), 400
+
+    return _action_response(
+        {"action": "create", "new_topic": topic, "new_message": message},
+        data.get("user_id"),
+        success_status=201,
+    )
+
+
+@app.route("/api/notes/<int:note_id>", methods=["PATCH"])
+def update_note(note_id: int):
+    data = request.get_json() or {}
+    topic = data.get("topic")
+    message = data.get("message")
+
+    if not topic and not message:
+        return jsonify({"error": "topic or message required"}), 400
+
+    return _action_response(
         {
-            "parsed_action": action_obj.model_dump(),
-            "result": result,
-        }
+            "action": "update",
+            "note_id": note_id,
+            "new_topic": topic,
+            "new_message": message,
+        },
+        data.get("user_id"),
     )
 
 
+@app.route("/api/notes/<int:note_id>", methods=["DELETE"])
+def delete_note(note_id: int):
+    data = request.get_json(silent=True) or {}
+    user_id = request.args.get("user_id", type=int) or data.get("user_id")
+
+    return _action_response({"action": "delete", "note_id": note_id}, user_id)
+
+
 # ============ Basic notes list endpoint ============
 
 @app.route("/api/notes", methods=["GET"])
@@ -254,10 +1102,209 @@ def list_notes():
     user_id = request.args.get("user_id", type=int)
     if not user_id:
         return jsonify({"error": "user_id required"}), 400
+    metrics.note_action("list")
+
+    limit = request.args.get("limit", type=int)
+    cursor = request.args.get("cursor")
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The ETag only changes when the user's notes do (notes_version) or a
+    # different page is asked for, so an unchanged listing costs one
+    # primary-key lookup and a 304 with no body.
+    with phase("db"):
+        version = get_notes_version(user_id)
+    etag = None
+    if version is not None:
+        etag = (
+            f"{user_id}-{version}-{clamp_page_size(limit)}-{cursor or ''}"
+            f"-{','.join(fields or ())}"
+        )
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+
+    try:
+        with phase("db"):
+            notes, next_cursor = paginate_notes(
+                project_notes(Note.query.filter_by(user_id=user_id), fields),
+                limit=limit,
+                cursor=cursor,
+            )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with phase("serialize"):
+        response = jsonify(
+            {
+                "notes": [n.to_dict(fields) for n in notes],
+                "next_cursor": next_cursor,
+            }
+        )
+    if etag:
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@app.route("/api/notes/search", methods=["GET"])
+def search_notes():
+    """
+    Similarity search: ?user_id=1&q=ml+homework[&q=...][&k=10][&fields=...]
+    Several q values are searched together; results come back per query,
+    best first, each note with its cosine "score". Notes scoring below
+    min_score (default SEMANTIC_MIN_SCORE) are left out.
+    """
+    user_id = request.args.get("user_id", type=int)
+    queries = [q for q in request.args.getlist("q") if q.strip()]
+    if not user_id:
+        return jsonify({"error": "user_id required"}), 400
+    if not queries:
+        return jsonify({"error": "q required"}), 400
+    try:
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    metrics.note_action("search")
+
+    with phase("db"):
+        results = semantic_search(
+            user_id,
+            queries,
+            clamp_page_size(request.args.get("k", 10)),
+            fields,
+            min_score=request.args.get("min_score", SEMANTIC_MIN_SCORE, type=float),
+        )
+    with phase("serialize"):
+        return jsonify(
+            {"results": [{"query": q, "notes": n} for q, n in zip(queries, results)]}
+        )
+
+
+# ============ Bulk export / import (NDJSON) ============
+# One JSON object per line, in the same shape as Note.to_dict(). Export
+# streams rows straight from a SQLite cursor and import inserts them in
+# fixed-size chunks, so neither holds a whole collection in memory.
+
+EXPORT_BATCH_SIZE = int(os.environ.get("NOTES_EXPORT_BATCH_SIZE", "1000"))
+IMPORT_CHUNK_SIZE = int(os.environ.get("NOTES_IMPORT_CHUNK_SIZE", "5000"))
+IMPORT_MAX_ERRORS = 20  # line errors echoed back; the rest are only counted
+
+
+@app.route("/api/notes/export", methods=["GET"])
+def export_notes():
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return jsonify({"error": "user_id required"}), 400
+    if get_notes_version(user_id) is None:
+        return jsonify({"error": "user not found"}), 404
+    metrics.note_action("export")
+
+    def lines():
+        notes = (
+            Note.query.filter_by(user_id=user_id)
+            .order_by(Note.note_id)
+            .yield_per(EXPORT_BATCH_SIZE)
+        )
+        for note in notes:
+            yield json.dumps(note.to_dict()) + "\n"
+
+    return Response(
+        stream_with_context(lines()),
+        mimetype="application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="notes-{user_id}.ndjson"'
+        },
+    )
+
+
+def _import_row(user_id: int, line: bytes, now: datetime) -> dict:
+    """
+    Turn one NDJSON line into a notes row. Raises ValueError if the line
+    is not a note with a non-empty topic and message.
+    """
+    try:
+        item = json.loads(line)
+    except (UnicodeError, ValueError) as e:
+        raise ValueError("not valid JSON") from e
+    if not isinstance(item, dict):
+        raise ValueError("expected a JSON object")
+
+    topic, message = item.get("topic"), item.get("message")
+    if not isinstance(topic, str) or not topic.strip():
+        raise ValueError("topic is required")
+    if not isinstance(message, str) or not message.strip():
+        raise ValueError("message is required")
+
+    last_update = now
+    if item.get("last_update"):
+        try:
+            last_update = datetime.fromisoformat(item["last_update"])
+        except (TypeError, ValueError) as e:
+            raise ValueError("last_update is not an ISO timestamp") from e
+
+    return {
+        "user_id": user_id,
+        "topic": topic[:255],
+        "message": message,
+        "last_update": last_update,
+    }
+
+
+def _insert_chunk(user_id: int, rows: list):
+    # One executemany and one commit per chunk; the FTS triggers index the
+    # rows inside the same transaction.
+    db.session.execute(db.insert(Note), rows)
+    bump_notes_version(user_id)
+    _save(commit=True)
+
+
+@app.route("/api/notes/import", methods=["POST"])
+def import_notes():
+    """
+    Bulk-create notes from an NDJSON body (e.g. a previous export).
+    note_id and user_id in the input are ignored; notes get new ids under
+    user_id. Invalid lines are skipped and reported by line number.
+    """
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return jsonify({"error": "user_id required"}), 400
+    if get_notes_version(user_id) is None:
+        return jsonify({"error": "user not found"}), 404
+    metrics.note_action("import")
 
-    notes = Note.query.filter_by(
-        user_id=user_id).order_by(Note.last_update.desc())
-    return jsonify({"notes": [n.to_dict() for n in notes]})
+    now = datetime.utcnow()
+    imported, errors, error_count = 0, [], 0
+    rows = []
+    with phase("db"):
+        # Buffered: iterating request.stream directly reads byte by byte.
+        body = io.BufferedReader(request.stream, buffer_size=1 << 16)
+        for line_no, line in enumerate(body, start=1):
+            if not line.strip():
+                continue
+            try:
+                rows.append(_import_row(user_id, line, now))
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({"line": line_no, "error": str(e)})
+                continue
+            if len(rows) >= IMPORT_CHUNK_SIZE:
+                _insert_chunk(user_id, rows)
+                imported += len(rows)
+                rows = []
+        if rows:
+            _insert_chunk(user_id, rows)
+            imported += len(rows)
+
+    status = 200 if imported or not error_count else 400
+    return jsonify(
+        {"imported": imported, "error_count": error_count, "errors": errors}
+    ), status
 
 
 if __name__ == "__main__":
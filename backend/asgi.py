@@ -0,0 +1,138 @@
+"""
+ASGI entry point, for serving the backend with an event loop:
+
+    cd backend
+    uvicorn asgi:application --port 5000
+
+Under a WSGI server every /api/nl_query request holds a worker thread
+for the whole LLM call, so the number of threads caps how many parses can
+be outstanding. Here the parse of an /api/nl_query body is awaited on the
+event loop (backend.ainvoke, i.e. chain.ainvoke for Ollama), and only
+then is the request handed to the Flask app, with the parse result, for
+the database work. Every other route goes straight to Flask. Flask runs
+on a pool of NOTES_ASGI_THREADS threads, so the database never blocks
+the loop, and /api/notes stays responsive while hundreds of parses wait
+on the model.
+
+How many parses actually run at once is still set by the LLM admission
+limiter (NOTES_LLM_MAX_CONCURRENT / NOTES_LLM_MAX_QUEUE in llm_agent).
+
+NOTES_ASYNC_NL_QUERY=0 sends /api/nl_query through Flask like any other
+route (the sync path, for comparisons; see bench/bench_async.py).
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import PREPARSED_ENVIRON_KEY, PreParsed, app, parse_nl_request
+from llm_agent import aparse_user_query_with_source
+
+ASGI_THREADS = int(os.environ.get("NOTES_ASGI_THREADS", "32"))
+ASYNC_NL_QUERY = os.environ.get("NOTES_ASYNC_NL_QUERY", "1") != "0"
+
+flask_threads = ThreadPoolExecutor(
+    max_workers=ASGI_THREADS, thread_name_prefix="flask"
+)
+
+
+class _FlaskInstance(WsgiToAsgiInstance):
+    # asgiref runs WSGI apps on a single shared thread by default, which
+    # would serialize every Flask request; use our pool instead. This
+    # rewraps the function behind asgiref's sync_to_async-decorated
+    # method, which is not public API: requirements.txt pins asgiref to
+    # the minor version this was written against.
+    run_wsgi_app = sync_to_async(
+        WsgiToAsgiInstance.__dict__["run_wsgi_app"].func,
+        thread_sensitive=False,
+        executor=flask_threads,
+    )
+
+    def build_environ(self, scope, body):
+        environ = super().build_environ(scope, body)
+        if PREPARSED_ENVIRON_KEY in scope:
+            environ[PREPARSED_ENVIRON_KEY] = scope[PREPARSED_ENVIRON_KEY]
+        return environ
+
+
+class _FlaskApp(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _FlaskInstance(self.wsgi_application, self.duplicate_header_limit)(
+            scope, receive, send
+        )
+
+
+flask_app = _FlaskApp(app)
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def _replay(body: bytes):
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return receive
+
+
+async def _preparse(body: bytes, started: float):
+    """
+    Parse the query of an /api/nl_query body, or None if the body is not
+    a valid request (the Flask view then answers it with a 400, without
+    an LLM call).
+    """
+    try:
+        _, query, _ = parse_nl_request(json.loads(body or b"null"))
+    except ValueError:
+        return None
+
+    try:
+        actions, parse_source = await aparse_user_query_with_source(query)
+    except Exception as e:
+        return PreParsed(query, started, time.perf_counter() - started, error=e)
+    return PreParsed(query, started, time.perf_counter() - started,
+                     actions=actions, parse_source=parse_source)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            flask_threads.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if (ASYNC_NL_QUERY and scope["type"] == "http"
+            and scope["method"] == "POST" and scope["path"] == "/api/nl_query"):
+        started = time.perf_counter()
+        body = await _read_body(receive)
+        preparsed = await _preparse(body, started)
+        if preparsed is not None:
+            scope = dict(scope, **{PREPARSED_ENVIRON_KEY: preparsed})
+        receive = _replay(body)
+    await flask_app(scope, receive, send)
@@ -0,0 +1,190 @@
+"""
+Compare the sync and async /api/nl_query paths under load: the same ASGI
+server (uvicorn asgi:application, NOTES_ASGI_THREADS Flask threads) once
+with NOTES_ASYNC_NL_QUERY=0, where each parse holds a Flask thread, and
+once with the parse awaited on the event loop. While the NL requests run,
+GET /api/notes is polled to see whether the rest of the API stays fast.
+
+    python bench/bench_async.py                       # 200 in flight, 8 threads
+    python bench/bench_async.py --concurrency 400 --threads 16 --latency-ms 2000
+
+Both servers use the stand-in parser on throwaway databases, with the
+LLM admission limiter opened up to --concurrency so it does not cap
+either path. Needs uvicorn and asgiref (requirements.txt).
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import BACKEND_DIR, format_summary, record_result, summarize
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, async_nl: bool, tmp_dir: str):
+    port = free_port()
+    name = "async" if async_nl else "sync"
+    env = dict(
+        os.environ,
+        NOTES_DB_PATH=os.path.join(tmp_dir, f"notes-{name}.db"),
+        NOTES_SEMANTIC_INDEX_PATH="",
+        PARSE_CACHE_DB="",
+        NOTES_LLM_BACKEND="standin",
+        NOTES_LLM_WARMUP="0",
+        NOTES_STANDIN_LATENCY_MS=str(args.latency_ms),
+        NOTES_STANDIN_LATENCY_SIGMA=str(args.latency_sigma),
+        NOTES_STANDIN_SEED="1",
+        NOTES_LLM_MAX_CONCURRENT=str(args.concurrency),
+        NOTES_LLM_MAX_QUEUE=str(args.concurrency),
+        NOTES_LLM_QUEUE_TIMEOUT=str(args.timeout),
+        NOTES_ASGI_THREADS=str(args.threads),
+        NOTES_ASYNC_NL_QUERY="1" if async_nl else "0",
+        PASSWORD_HASH_WORKERS="0",
+        PASSWORD_HASH_METHOD="pbkdf2:sha256:1000",
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "asgi:application",
+         "--port", str(port), "--log-level", "warning",
+         "--limit-concurrency", str(args.concurrency * 2)],
+        cwd=BACKEND_DIR, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while True:
+        try:
+            requests.get(f"{url}/api/metrics", timeout=1)
+            return proc, url
+        except requests.ConnectionError:
+            if proc.poll() is not None or time.time() > deadline:
+                proc.kill()
+                raise RuntimeError(f"{name} server did not start")
+            time.sleep(0.2)
+
+
+def create_user(url: str) -> int:
+    credentials = {"username": "bench", "password": "bench-password"}
+    requests.post(f"{url}/api/register", json=credentials, timeout=10)
+    resp = requests.post(f"{url}/api/login", json=credentials, timeout=10)
+    return resp.json()["user"]["user_id"]
+
+
+def run(url: str, user_id: int, args) -> dict:
+    local = threading.local()
+    lock = threading.Lock()
+    nl_latencies, errors = [], 0
+    load_over = threading.Event()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    def nl_query(n):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            resp = session().post(f"{url}/api/nl_query", json={
+                "user_id": user_id,
+                "query": f"what did I write about project {n} last week",
+            }, timeout=args.timeout)
+            ok = resp.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                nl_latencies.append(elapsed)
+            else:
+                errors += 1
+
+    notes_latencies = []
+
+    def poll_notes():
+        poll_session = requests.Session()
+        while not load_over.is_set():
+            start = time.perf_counter()
+            poll_session.get(f"{url}/api/notes",
+                             params={"user_id": user_id}, timeout=args.timeout)
+            notes_latencies.append(time.perf_counter() - start)
+            time.sleep(args.poll_interval)
+
+    poller = threading.Thread(target=poll_notes)
+    poller.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(nl_query, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    load_over.set()
+    poller.join()
+
+    return {
+        "errors": errors,
+        "nl_query": summarize(nl_latencies, elapsed),
+        "notes_during_load": summarize(notes_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=200,
+                        help="NL requests in flight at once")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=8,
+                        help="Flask threads in the server (NOTES_ASGI_THREADS)")
+    parser.add_argument("--latency-ms", type=float, default=1000.0,
+                        help="stand-in median parse latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--poll-interval", type=float, default=0.05,
+                        help="seconds between GET /api/notes probes")
+    parser.add_argument("--no-record", action="store_true",
+                        help="do not append this run to bench/results.jsonl")
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="notes-bench-")
+    report = {}
+    for name, async_nl in (("sync", False), ("async", True)):
+        proc, url = start_server(args, async_nl, tmp_dir)
+        try:
+            report[name] = run(url, create_user(url), args)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    if not args.no_record:
+        params = {k: getattr(args, k) for k in
+                  ("concurrency", "requests", "threads", "latency_ms", "latency_sigma")}
+        record_result("async", params, {
+            f"{name}_{part}": report[name][part]
+            for name in report for part in ("nl_query", "notes_during_load")
+        })
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"concurrency={args.concurrency} requests={args.requests} "
+          f"threads={args.threads} latency={args.latency_ms:.0f}ms")
+    for name, result in report.items():
+        print(f"{name}: errors={result['errors']}")
+        print(format_summary("  POST /api/nl_query", result["nl_query"]))
+        print(format_summary("  GET /api/notes during load",
+                             result["notes_during_load"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Time the database paths (perform_action CRUD/search, GET /api/notes and
+the auth endpoints) on a synthetic dataset in a throwaway SQLite file.
+No LLM is involved: NoteAction objects are built directly.
+
+    python bench/bench_db.py                       # 1k users, 100k notes
+    python bench/bench_db.py --users 10000 --notes 1000000
+
+Notes per user follow a Zipf-like distribution (a few power users own
+most notes) and message sizes are log-normal. Every run is appended to
+bench/results.jsonl; the run is compared with the previous one that used
+the same parameters and regressions in p50 are reported (exit code 1
+with --fail-on-regression).
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import (
+    format_summary,
+    previous_result,
+    record_result,
+    regressions,
+    summarize,
+)
+
+WORDS = (
+    "exam assignment meeting python database index query note project "
+    "deadline lecture transformer attention model training data homework "
+    "grocery trip budget flight hotel zoom chapter function review draft "
+    "report slides team sprint bug release design schema migration cache"
+).split()
+
+
+def generate_dataset(db_file: str, args, password_hash: str):
+    """
+    Bulk-insert users and notes straight through sqlite3 (the schema and
+    FTS triggers were already created by the app). Returns per-user note
+    counts.
+    """
+    rng = random.Random(args.seed)
+    weights = [1.0 / (rank + 1) ** args.skew for rank in range(args.users)]
+    owners = rng.choices(range(1, args.users + 1), weights=weights, k=args.notes)
+    counts = {}
+    for user_id in owners:
+        counts[user_id] = counts.get(user_id, 0) + 1
+
+    start_time = datetime(2025, 1, 1)
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (user_id, username, password) VALUES (?, ?, ?)",
+            ((i, f"user{i}", password_hash) for i in range(1, args.users + 1)),
+        )
+
+    def note_rows(owner_chunk):
+        for user_id in owner_chunk:
+            size = min(20_000, int(rng.lognormvariate(math.log(args.message_chars), 1.0)))
+            words = rng.choices(WORDS, k=max(1, size // 7))
+            yield (
+                user_id,
+                " ".join(rng.choices(WORDS, k=rng.randint(1, 4))),
+                " ".join(words),
+                start_time + timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+            )
+
+    chunk = 50_000
+    for offset in range(0, len(owners), chunk):
+        with conn:
+            conn.executemany(
+                "INSERT INTO notes (user_id, topic, message, last_update) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (u, t, m, ts.strftime("%Y-%m-%d %H:%M:%S.%f"))
+                    for u, t, m, ts in note_rows(owners[offset:offset + chunk])
+                ),
+            )
+    conn.execute("ANALYZE")
+    conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--notes", type=int, default=100_000)
+    parser.add_argument("--skew", type=float, default=1.1,
+                        help="Zipf exponent for notes per user")
+    parser.add_argument("--message-chars", type=int, default=300,
+                        help="median message length")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--auth-iterations", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-record", action="store_true",
+                        help="do not append this run to bench/results.jsonl")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="notes-bench-db-")
+    db_file = os.path.join(tmp_dir, "notes.db")
+    os.environ["NOTES_DB_PATH"] = db_file
+    os.environ["PARSE_CACHE_DB"] = ""
+    os.environ["NOTES_SEMANTIC_INDEX_PATH"] = ""
+    os.environ.setdefault("NOTES_LLM_BACKEND", "standin")
+
+    # Imported after NOTES_DB_PATH is set so the app opens the temp database.
+    from werkzeug.security import generate_password_hash
+    from app import app, encode_cursor, perform_action
+    from llm_agent import NoteAction
+    from models import db, Note
+
+    password = "bench-password"
+    started = time.perf_counter()
+    counts = generate_dataset(db_file, args, generate_password_hash(password))
+    print(f"generated {args.users} users / {args.notes} notes in "
+          f"{time.perf_counter() - started:.1f}s ({db_file})")
+
+    rng = random.Random(args.seed + 1)
+    user_ids = list(counts)
+    user_weights = [counts[u] for u in user_ids]
+    power_user = max(counts, key=counts.get)
+    print(f"power user {power_user} owns {counts[power_user]} notes")
+
+    timings = {}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        fn()
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+
+    def any_note(user_id):
+        return Note.query.filter_by(user_id=user_id).first()
+
+    client = app.test_client()
+    with app.app_context():
+        for _ in range(args.iterations):
+            for label, user_id in (
+                ("typical", rng.choices(user_ids, weights=user_weights)[0]),
+                ("power", power_user),
+            ):
+                word = rng.choice(WORDS)
+                note = any_note(user_id)
+
+                timed(f"list_first_page[{label}]", lambda: perform_action(
+                    user_id, NoteAction(action="list")))
+                cursor = encode_cursor(note) if note else None
+                timed(f"list_cursor_page[{label}]", lambda: perform_action(
+                    user_id, NoteAction(action="list"), cursor=cursor))
+                timed(f"read_by_id[{label}]", lambda: perform_action(
+                    user_id, NoteAction(action="read", note_id=note.note_id)))
+                timed(f"search[{label}]", lambda: perform_action(
+                    user_id, NoteAction(action="read", search_query=word)))
+                timed(f"get_api_notes[{label}]", lambda: client.get(
+                    "/api/notes", query_string={"user_id": user_id}))
+
+                created = {}
+                timed(f"create[{label}]", lambda: created.update(perform_action(
+                    user_id, NoteAction(action="create", new_topic=f"bench {word}",
+                                        new_message="benchmark " * 30))))
+                new_id = created["note"]["note_id"]
+                timed(f"update_by_id[{label}]", lambda: perform_action(
+                    user_id, NoteAction(action="update", note_id=new_id,
+                                        new_message="updated " * 30)))
+                timed(f"update_by_topic[{label}]", lambda: perform_action(
+                    user_id, NoteAction(action="update", target_topic=f"bench {word}",
+                                        new_message="updated again")))
+                timed(f"delete_by_id[{label}]", lambda: perform_action(
+                    user_id, NoteAction(action="delete", note_id=new_id)))
+
+        for i in range(args.auth_iterations):
+            username = f"user{rng.choice(user_ids)}"
+            timed("login", lambda: client.post(
+                "/api/login", json={"username": username, "password": password}))
+            timed("register", lambda: client.post(
+                "/api/register",
+                json={"username": f"bench-new-{i}-{time.time()}", "password": password},
+            ))
+
+    results = {name: summarize(values) for name, values in sorted(timings.items())}
+    for name, summary in results.items():
+        print(format_summary(name, summary))
+
+    params = {k: v for k, v in vars(args).items()
+              if k not in ("no_record", "fail_on_regression")}
+    previous = previous_result("db", params)
+    if not args.no_record:
+        record_result("db", params, results)
+
+    if previous:
+        worse = regressions(previous["results"], results)
+        for name, before, after in worse:
+            print(f"REGRESSION {name}: p50 {before:.2f}ms -> {after:.2f}ms "
+                  f"(vs {previous['revision']} at {previous['timestamp']})")
+        if worse and args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
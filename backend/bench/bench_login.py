@@ -0,0 +1,137 @@
+"""
+Measure login throughput while a login storm runs, and how GET /api/notes
+latency holds up next to it. The app runs in-process (Flask test client)
+on a throwaway database.
+
+    python bench/bench_login.py                          # process pool
+    python bench/bench_login.py --workers 0              # hash inline
+    python bench/bench_login.py --method pbkdf2:sha256:600000 --workers 2
+
+Throughput is reported per hashing worker (or per CPU when hashing
+inline), i.e. roughly logins per core.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import format_summary, summarize
+
+
+def setup_app(args):
+    tmp_dir = tempfile.mkdtemp(prefix="notes-bench-")
+    os.environ["NOTES_DB_PATH"] = os.path.join(tmp_dir, "notes.db")
+    os.environ["PARSE_CACHE_DB"] = ""
+    os.environ["NOTES_SEMANTIC_INDEX_PATH"] = ""
+    os.environ["NOTES_LLM_BACKEND"] = "standin"
+    os.environ["PASSWORD_HASH_METHOD"] = args.method
+    os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+    os.environ["PASSWORD_HASH_MAX_PENDING"] = str(args.max_pending)
+
+    # Imported after the environment is set up so the app picks it up.
+    from app import app
+
+    client = app.test_client()
+    for i in range(args.users):
+        resp = client.post("/api/register", json={
+            "username": f"bench{i}", "password": f"password-{i}"})
+        assert resp.status_code == 201, resp.get_json()
+    resp = client.post("/api/login", json={
+        "username": "bench0", "password": "password-0"})
+    return app, resp.get_json()["user"]["user_id"]
+
+
+def run(app, user_id, args):
+    local = threading.local()
+    lock = threading.Lock()
+    login_latencies, rejected, failed = [], 0, 0
+    storm_over = threading.Event()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        return local.client
+
+    def login(n):
+        nonlocal rejected, failed
+        i = n % args.users
+        start = time.perf_counter()
+        resp = client().post("/api/login", json={
+            "username": f"bench{i}", "password": f"password-{i}"})
+        elapsed = time.perf_counter() - start
+        with lock:
+            if resp.status_code == 200:
+                login_latencies.append(elapsed)
+            elif resp.status_code == 503:
+                rejected += 1
+            else:
+                failed += 1
+
+    notes_latencies = []
+
+    def poll_notes():
+        notes_client = app.test_client()
+        while not storm_over.is_set():
+            start = time.perf_counter()
+            notes_client.get("/api/notes", query_string={"user_id": user_id})
+            notes_latencies.append(time.perf_counter() - start)
+            time.sleep(args.poll_interval)
+
+    poller = threading.Thread(target=poll_notes)
+    poller.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - started
+    storm_over.set()
+    poller.join()
+
+    login_summary = summarize(login_latencies, elapsed)
+    cores = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    return {
+        "method": args.method,
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "rejected": rejected,
+        "failed": failed,
+        "login": login_summary,
+        "logins_per_s_per_worker": login_summary["throughput_per_s"] / max(1, cores),
+        "notes_during_storm": summarize(notes_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--method", default="scrypt",
+                        help="Werkzeug hash method (PASSWORD_HASH_METHOD)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="hashing processes, 0 = hash on request threads")
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--poll-interval", type=float, default=0.02,
+                        help="seconds between GET /api/notes probes")
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    args = parser.parse_args()
+
+    app, user_id = setup_app(args)
+    report = run(app, user_id, args)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"method={report['method']} workers={report['workers']} "
+          f"concurrency={report['concurrency']} rejected={report['rejected']} "
+          f"failed={report['failed']}")
+    print(format_summary("login", report["login"]))
+    print(f"  {report['logins_per_s_per_worker']:.1f} logins/s per worker")
+    print(format_summary("GET /api/notes during storm", report["notes_during_storm"]))
+
+
+if __name__ == "__main__":
+    main()
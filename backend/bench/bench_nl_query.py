@@ -0,0 +1,165 @@
+"""
+Load-test /api/nl_query at a fixed concurrency and report latency
+percentiles and throughput.
+
+By default the app runs in-process (Flask test client) on a throwaway
+database with the offline stand-in parser, so no Ollama server is needed:
+
+    python bench/bench_nl_query.py --concurrency 8 --requests 400
+    python bench/bench_nl_query.py --latency-ms 1500 --latency-sigma 0.8 \\
+        --error-rate 0.02
+
+Or drive a running server (whatever backend it was started with):
+
+    python bench/bench_nl_query.py --url http://localhost:5000 --user-id 1
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import format_summary, summarize
+
+# A mix of rule-parsable requests and free-form ones that need the parser
+# backend. {n} is replaced with a request number so creates stay distinct.
+QUERY_MIX = [
+    "Show all my notes",
+    "help",
+    "Create a note about load test {n} that says generated by the benchmark",
+    "Delete note 999999",
+    "what did I write about the zoom meeting",
+    "anything due next week?",
+    "find the note where I planned the trip {n}",
+    "remind me what the exam covers",
+]
+
+
+def make_local_client(args):
+    tmp_dir = tempfile.mkdtemp(prefix="notes-bench-")
+    os.environ["NOTES_DB_PATH"] = os.path.join(tmp_dir, "notes.db")
+    os.environ["PARSE_CACHE_DB"] = ""
+    os.environ["NOTES_SEMANTIC_INDEX_PATH"] = ""
+    os.environ["NOTES_LLM_BACKEND"] = "standin"
+    os.environ["NOTES_STANDIN_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["NOTES_STANDIN_LATENCY_SIGMA"] = str(args.latency_sigma)
+    os.environ["NOTES_STANDIN_ERROR_RATE"] = str(args.error_rate)
+    os.environ["NOTES_STANDIN_SEED"] = str(args.seed)
+
+    # Imported after the environment is set up so the app picks it up.
+    from app import app
+    from models import db, User
+
+    with app.app_context():
+        user = User(username="bench", password="x")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.user_id
+
+    local = threading.local()
+
+    def post(query):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        resp = local.client.post(
+            "/api/nl_query", json={"user_id": user_id, "query": query})
+        return resp.status_code, resp.get_json()
+
+    return post
+
+
+def make_http_client(args):
+    import requests
+
+    local = threading.local()
+
+    def post(query):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        resp = local.session.post(
+            f"{args.url}/api/nl_query",
+            json={"user_id": args.user_id, "query": query},
+            timeout=args.timeout,
+        )
+        return resp.status_code, resp.json()
+
+    return post
+
+
+def run(post, args):
+    rng = random.Random(args.seed)
+    queries = [
+        rng.choice(QUERY_MIX).format(n=i) for i in range(args.requests)
+    ]
+    lock = threading.Lock()
+    latencies, by_source, errors = [], {}, 0
+
+    def one(query):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            status, body = post(query)
+        except Exception:
+            status, body = None, {}
+        elapsed = time.perf_counter() - start
+        with lock:
+            if status == 200:
+                latencies.append(elapsed)
+                source = body.get("parse_source", "?")
+                by_source.setdefault(source, []).append(elapsed)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, queries))
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "errors": errors,
+        "overall": summarize(latencies, elapsed),
+        "by_parse_source": {
+            source: summarize(values) for source, values in by_source.items()
+        },
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--latency-ms", type=float, default=800.0,
+                        help="stand-in median parse latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="stand-in log-normal sigma (0 = fixed latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="stand-in probability of a failed parse")
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    args = parser.parse_args()
+
+    post = make_http_client(args) if args.url else make_local_client(args)
+    report = run(post, args)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"concurrency={report['concurrency']} requests={report['requests']} "
+          f"errors={report['errors']}")
+    print(format_summary("overall", report["overall"]))
+    for source, summary in sorted(report["by_parse_source"].items()):
+        print(format_summary(f"  {source}", summary))
+
+
+if __name__ == "__main__":
+    main()
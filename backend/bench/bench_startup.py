@@ -0,0 +1,122 @@
+"""
+Measure backend cold start: how long `import app` takes in a fresh
+interpreter (schema setup and migrations included, on a throwaway
+database), and which imports dominate it.
+
+    python bench/bench_startup.py                  # 5 runs
+    python bench/bench_startup.py --budget-ms 1500
+
+Each run is a new `python -X importtime` process with NOTES_LLM_WARMUP=0,
+so the background warm-up does not compete with the import. The run
+fails (exit code 1) if the median import time exceeds --budget-ms or if
+a module listed in LAZY_MODULES was imported at startup.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import BACKEND_DIR, format_summary, record_result, summarize
+
+# Only needed once an NL request arrives; see llm_agent.OllamaBackend.
+LAZY_MODULES = ("langchain_core", "langchain_ollama", "ollama")
+
+PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import app\n"
+    "print('elapsed', time.perf_counter() - start)\n"
+    "print('loaded', ','.join(sorted(sys.modules)))\n"
+)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    {package: cumulative microseconds} for the modules `import app`
+    pulled in directly, from -X importtime output. The name column is
+    indented two spaces per nesting level, and each line's cumulative time
+    already includes everything nested under it.
+    """
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth != 1:
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(cumulative)
+    return totals
+
+
+def run_once(tmp_dir: str, n: int):
+    env = dict(
+        os.environ,
+        NOTES_DB_PATH=os.path.join(tmp_dir, f"notes-{n}.db"),
+        PARSE_CACHE_DB="",
+        NOTES_LLM_WARMUP="0",
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    elapsed, loaded = None, set()
+    for line in proc.stdout.splitlines():
+        if line.startswith("elapsed "):
+            elapsed = float(line.split()[1])
+        elif line.startswith("loaded "):
+            loaded = set(line[len("loaded "):].split(","))
+    return elapsed, loaded, parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2000.0,
+                        help="fail if the median import time exceeds this")
+    parser.add_argument("--top", type=int, default=10,
+                        help="how many of the slowest imports to list")
+    parser.add_argument("--no-record", action="store_true",
+                        help="do not append this run to bench/results.jsonl")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="notes-bench-")
+    timings, packages, eager = [], {}, set()
+    for n in range(args.runs):
+        elapsed, loaded, totals = run_once(tmp_dir, n)
+        timings.append(elapsed)
+        eager |= {m for m in loaded if m.split(".")[0] in LAZY_MODULES}
+        for package, micros in totals.items():
+            packages.setdefault(package, []).append(micros)
+
+    summary = summarize(timings)
+    print(format_summary("import app", summary))
+    print("slowest imports made by app.py (median cumulative):")
+    slowest = sorted(
+        ((statistics.median(v) / 1000, p) for p, v in packages.items()),
+        reverse=True,
+    )[:args.top]
+    for millis, package in slowest:
+        print(f"  {package:<28} {millis:8.1f}ms")
+
+    if not args.no_record:
+        record_result("startup", {"runs": args.runs}, {"import_app": summary})
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(sorted(eager))}")
+        failed = True
+    if summary["p50_ms"] > args.budget_ms:
+        print(f"FAIL: median import {summary['p50_ms']:.0f}ms "
+              f"over budget {args.budget_ms:.0f}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
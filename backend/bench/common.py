@@ -0,0 +1,120 @@
+"""
+Helpers shared by the benchmark scripts in this folder.
+
+The scripts import the backend modules directly (app, models, llm_agent),
+so BACKEND_DIR is put on sys.path the same way `cd backend && python
+app.py` would.
+"""
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_FILE = os.path.join(BENCH_DIR, "results.jsonl")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+def summarize(latencies, elapsed: float = None) -> dict:
+    """
+    Summarize a list of latencies in seconds as milliseconds.
+    If elapsed wall time is given, also report throughput.
+    """
+    values = sorted(latencies)
+    summary = {
+        "count": len(values),
+        "mean_ms": statistics.fmean(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0,
+    }
+    if elapsed:
+        summary["throughput_per_s"] = len(values) / elapsed
+    return summary
+
+
+def format_summary(name: str, summary: dict) -> str:
+    parts = [f"{name}: n={summary['count']}"]
+    for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms"):
+        parts.append(f"{key[:-3]}={summary[key]:.2f}ms")
+    if "throughput_per_s" in summary:
+        parts.append(f"{summary['throughput_per_s']:.1f}/s")
+    return " ".join(parts)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def record_result(suite: str, params: dict, results: dict,
+                  path: str = RESULTS_FILE) -> dict:
+    """
+    Append one benchmark run as a JSON line, so runs can be compared over
+    time. Returns the record that was written.
+    """
+    record = {
+        "suite": suite,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": params,
+        "results": results,
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+    return record
+
+
+def previous_result(suite: str, params: dict, path: str = RESULTS_FILE):
+    """
+    The most recent recorded run of suite with identical params, or None.
+    """
+    if not os.path.exists(path):
+        return None
+    latest = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["suite"] == suite and record["params"] == params:
+                latest = record
+    return latest
+
+
+def regressions(previous: dict, current: dict, metric: str = "p50_ms",
+                tolerance: float = 0.2):
+    """
+    Names of results whose metric got worse by more than tolerance
+    (a fraction) compared to previous, with both values.
+    """
+    worse = []
+    for name, summary in current.items():
+        before = previous.get(name, {}).get(metric)
+        after = summary.get(metric)
+        if before and after and after > before * (1 + tolerance):
+            worse.append((name, before, after))
+    return worse
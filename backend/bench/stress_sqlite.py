@@ -0,0 +1,134 @@
+"""
+Stress the SQLite setup with concurrent readers while writers create and
+update notes, against a throwaway database.
+
+    python bench/stress_sqlite.py --readers 8 --writers 2 --seconds 10
+
+Compare with SQLite's defaults (rollback journal, no busy timeout):
+
+    NOTES_SQLITE_JOURNAL_MODE=DELETE NOTES_SQLITE_BUSY_TIMEOUT_MS=0 \\
+        python bench/stress_sqlite.py
+
+Exits non-zero if any request failed (e.g. "database is locked").
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from common import format_summary, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seed-notes", type=int, default=200,
+                        help="notes per user before the run starts")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="notes-stress-")
+    os.environ["NOTES_DB_PATH"] = os.path.join(tmp_dir, "notes.db")
+    os.environ.setdefault("PARSE_CACHE_DB", "")
+    os.environ.setdefault("NOTES_SEMANTIC_INDEX_PATH", "")
+
+    # Imported after NOTES_DB_PATH is set so the app opens the temp database.
+    from app import app, perform_action
+    from llm_agent import NoteAction
+    from models import db, Note, User
+
+    app.config["PROPAGATE_EXCEPTIONS"] = True
+
+    with app.app_context():
+        print("pragmas:", {
+            name: db.session.execute(db.text(f"PRAGMA {name}")).scalar()
+            for name in app.config["SQLITE_PRAGMAS"]
+        })
+        for i in range(args.users):
+            db.session.add(User(username=f"stress{i}", password="x"))
+        db.session.commit()
+        user_ids = [u.user_id for u in User.query.all()]
+        for user_id in user_ids:
+            db.session.add_all(
+                Note(user_id=user_id, topic=f"topic {j}", message="seed " * 40)
+                for j in range(args.seed_notes)
+            )
+        db.session.commit()
+        seed_ids = {
+            user_id: [note_id for (note_id,) in db.session.query(Note.note_id)
+                      .filter_by(user_id=user_id)]
+            for user_id in user_ids
+        }
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    read_latencies, write_latencies, errors = [], [], []
+
+    def reader():
+        client = app.test_client()
+        while not stop.is_set():
+            user_id = random.choice(user_ids)
+            start = time.perf_counter()
+            try:
+                resp = client.get("/api/notes", query_string={"user_id": user_id})
+                ok = resp.status_code == 200
+            except Exception as e:
+                ok, resp = False, e
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    read_latencies.append(elapsed)
+                else:
+                    errors.append(f"read: {resp}")
+
+    def writer():
+        while not stop.is_set():
+            user_id = random.choice(user_ids)
+            if random.random() < 0.5:
+                action = NoteAction(action="create", new_topic="stress",
+                                    new_message="written " * 40)
+            else:
+                action = NoteAction(action="update",
+                                    note_id=random.choice(seed_ids[user_id]),
+                                    new_message=f"updated {time.time()}")
+            start = time.perf_counter()
+            with app.app_context():
+                try:
+                    result = perform_action(user_id, action)
+                    error = result.get("error")
+                    ok = error is None
+                except Exception as e:
+                    db.session.rollback()
+                    ok, error = False, e
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    write_latencies.append(elapsed)
+                else:
+                    errors.append(f"write: {error}")
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer) for _ in range(args.writers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    print(format_summary("reads", summarize(read_latencies, elapsed)))
+    print(format_summary("writes", summarize(write_latencies, elapsed)))
+    print(f"errors: {len(errors)}")
+    for error in sorted(set(errors))[:5]:
+        print(f"    {error}")
+    raise SystemExit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,21 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import Iterator, List, Optional, Literal, Tuple
 
-from langchain_ollama import ChatOllama
-from langchain_core.prompts import ChatPromptTemplate
+import metrics
+from admission import AdmissionLimiter
+from model_lifecycle import ModelLifecycle
+from parse_cache import KEY_FORMAT, ParseCache, normalize_query
+from single_flight import SingleFlight
 
 
 # -------------------------
@@ -42,16 +55,34 @@ class NoteAction(BaseModel):
     )
 
 
+class NoteActionList(BaseModel):
+    """
+    All the actions requested in one user message, in the order they
+    should run ("create a note about X and delete note 3" is two actions).
+    """
+
+    actions: List[NoteAction] = Field(
+        ...,
+        min_length=1,
+        description="The actions to perform, in order."
+    )
+
+
 # -------------------------
 # LLM (Ollama) Configuration
 # -------------------------
-model = ChatOllama(
-    model="llama3",
-    temperature=0.1,
-)
+MODEL_NAME = "llama3"
+MODEL_TEMPERATURE = 0.1
+# How long Ollama keeps the model loaded after a request, and how often
+# the lifecycle manager checks that it still is (0 = never).
+MODEL_KEEP_ALIVE = os.environ.get("NOTES_LLM_KEEP_ALIVE", "30m")
+MODEL_PROBE_INTERVAL = float(os.environ.get("NOTES_LLM_PROBE_INTERVAL", "60"))
 
 system_instructions = """
-You convert a user's natural language into a structured JSON NoteAction.
+You convert a user's natural language into a structured JSON NoteActionList:
+an object with one key, "actions", holding a list of NoteAction objects.
+Most messages ask for ONE action; return one NoteAction per separate request
+when the user asks for several things, in the order they asked for them.
 
 The NoteAction fields are:
 
@@ -105,20 +136,708 @@ If the user wants to delete/remove a note:
 If the user is confused or asking about usage:
 - action = "help"
 
-ALWAYS return ONLY a JSON object matching the NoteAction schema.
+### SEVERAL REQUESTS IN ONE MESSAGE
+3. "create a note about groceries that says buy milk and delete note 3"
+   -> actions=[
+        action="create", new_topic="groceries", new_message="buy milk"
+        action="delete", note_id=3
+      ]
+
+ALWAYS return ONLY a JSON object matching the NoteActionList schema.
 No extra text.
 """
 
-prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", system_instructions),
-        ("human", "{user_input}"),
-    ]
+_prompt = None
+
+
+def get_prompt():
+    """
+    The LangChain prompt, built on first use: importing LangChain takes
+    longer than the rest of the backend's startup, and only NL requests
+    need it.
+    """
+    global _prompt
+    if _prompt is None:
+        from langchain_core.prompts import ChatPromptTemplate
+
+        _prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", system_instructions),
+                ("human", "{user_input}"),
+            ]
+        )
+    return _prompt
+
+
+# -------------------------
+# Parser backends
+# -------------------------
+# A backend turns one user message into a NoteActionList. The app talks to
+# whichever backend NOTES_LLM_BACKEND selects ("ollama" by default,
+# "standin" for benchmarks and CI boxes without a model server).
+
+class ParserBackend:
+    """
+    Interface every parser backend implements.
+    """
+
+    name = "base"
+
+    def identity(self) -> str:
+        """
+        Everything that affects the parses this backend returns; part of
+        the parse cache version.
+        """
+        return self.name
+
+    def warm(self):
+        """
+        Do any expensive one-time setup now rather than on the first parse.
+        """
+
+    def status(self) -> dict:
+        """
+        Health and warm/cold details for /api/llm/status.
+        """
+        return {"backend": self.name}
+
+    def invoke(self, user_input: str) -> NoteActionList:
+        raise NotImplementedError
+
+    async def ainvoke(self, user_input: str) -> NoteActionList:
+        """
+        invoke() for the async server. Backends without a native async
+        call run invoke() on a worker thread.
+        """
+        return await asyncio.to_thread(self.invoke, user_input)
+
+    def stream(self, user_input: str) -> Iterator[str]:
+        """
+        Yield the NoteActionList JSON text in chunks as it is generated.
+        """
+        yield self.invoke(user_input).model_dump_json()
+
+
+class OllamaBackend(ParserBackend):
+    """
+    The real parser: the prompt above run against a local Ollama model.
+
+    LangChain and the chains are set up on the first parse (or by warm()),
+    not in __init__, so the app can start serving before they are ready.
+    warm() also loads the model in Ollama and starts the lifecycle
+    manager's keep-alive probe (see model_lifecycle.py).
+    """
+
+    name = "ollama"
+
+    def __init__(self, model_name: str = MODEL_NAME,
+                 temperature: float = MODEL_TEMPERATURE,
+                 keep_alive: str = MODEL_KEEP_ALIVE,
+                 probe_interval: float = MODEL_PROBE_INTERVAL):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.keep_alive = keep_alive
+        self.lifecycle = ModelLifecycle(
+            model_name, keep_alive=keep_alive, probe_interval=probe_interval
+        )
+        self.model = None
+        self.chain = None
+        self.stream_chain = None
+        self._init_lock = threading.Lock()
+
+    def identity(self) -> str:
+        return f"{self.name}:{self.model_name}:{self.temperature}"
+
+    def warm(self):
+        self._ensure_chains()
+        self.lifecycle.start()
+
+    def status(self) -> dict:
+        return dict(self.lifecycle.status(), backend=self.name)
+
+    def _ensure_chains(self):
+        if self.chain is not None:
+            return
+        with self._init_lock:
+            if self.chain is not None:
+                return
+            from langchain_ollama import ChatOllama
+
+            prompt = get_prompt()
+            self.model = ChatOllama(model=self.model_name,
+                                    temperature=self.temperature,
+                                    keep_alive=self.keep_alive)
+            # Same prompt, but the raw JSON text is streamed token by token
+            # (Ollama constrains the output to the NoteActionList schema) so
+            # callers can show progress before the whole list is parsed.
+            self.stream_chain = prompt | self.model.bind(
+                format=NoteActionList.model_json_schema()
+            )
+            # include_raw keeps the AIMessage, whose metadata says how long
+            # Ollama spent loading the model for this call.
+            self.chain = prompt | self.model.with_structured_output(
+                NoteActionList, include_raw=True
+            )
+
+    def invoke(self, user_input: str) -> NoteActionList:
+        self._ensure_chains()
+        return self._parsed(self.chain.invoke({"user_input": user_input}))
+
+    async def ainvoke(self, user_input: str) -> NoteActionList:
+        if self.chain is None:
+            # Importing LangChain takes a while; not on the event loop.
+            await asyncio.to_thread(self._ensure_chains)
+        return self._parsed(await self.chain.ainvoke({"user_input": user_input}))
+
+    def _parsed(self, output: dict) -> NoteActionList:
+        self.lifecycle.record(output["raw"].response_metadata)
+        if output["parsing_error"] is not None:
+            raise output["parsing_error"]
+        return output["parsed"]
+
+    def stream(self, user_input: str) -> Iterator[str]:
+        self._ensure_chains()
+        for chunk in self.stream_chain.stream({"user_input": user_input}):
+            # Ollama reports load_duration on the final chunk.
+            if chunk.response_metadata:
+                self.lifecycle.record(chunk.response_metadata)
+            if chunk.content:
+                yield chunk.content
+
+
+class StandInError(RuntimeError):
+    pass
+
+
+class StandInBackend(ParserBackend):
+    """
+    Deterministic offline stand-in for the LLM, for load tests and CI.
+
+    Parses with the fast-path rules (splitting "X and Y" into several
+    actions) and treats anything else as a search. Each call sleeps for a
+    latency drawn from a log-normal distribution with the given median
+    and sigma (sigma=0 gives a fixed latency) and fails with StandInError
+    at error_rate. A seed makes the latency/error sequence reproducible.
+    """
+
+    name = "standin"
+
+    def __init__(self, latency_ms: float = 800.0, latency_sigma: float = 0.5,
+                 error_rate: float = 0.0, seed: Optional[int] = None,
+                 stream_chunks: int = 8):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.stream_chunks = stream_chunks
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self) -> Tuple[float, bool]:
+        with self._lock:
+            latency = self.latency_ms / 1000.0
+            if self.latency_sigma > 0:
+                latency *= math.exp(self._random.gauss(0.0, self.latency_sigma))
+            return latency, self._random.random() < self.error_rate
+
+    def _parse(self, user_input: str) -> NoteActionList:
+        action = fast_parse(user_input)
+        if action is not None:
+            return NoteActionList(actions=[action])
+
+        parts = re.split(r"\s+(?:and\s+then|and|then)\s+", user_input.strip())
+        actions = [fast_parse(part) for part in parts]
+        if len(parts) > 1 and all(actions):
+            return NoteActionList(actions=actions)
+
+        return NoteActionList(
+            actions=[NoteAction(action="read", search_query=user_input.strip())]
+        )
+
+    def invoke(self, user_input: str) -> NoteActionList:
+        latency, fail = self._draw()
+        time.sleep(latency)
+        if fail:
+            raise StandInError("stand-in backend: simulated model failure")
+        return self._parse(user_input)
+
+    async def ainvoke(self, user_input: str) -> NoteActionList:
+        latency, fail = self._draw()
+        await asyncio.sleep(latency)
+        if fail:
+            raise StandInError("stand-in backend: simulated model failure")
+        return self._parse(user_input)
+
+    def stream(self, user_input: str) -> Iterator[str]:
+        latency, fail = self._draw()
+        text = self._parse(user_input).model_dump_json()
+        size = max(1, math.ceil(len(text) / self.stream_chunks))
+        for start in range(0, len(text), size):
+            time.sleep(latency / self.stream_chunks)
+            if fail:
+                raise StandInError("stand-in backend: simulated model failure")
+            yield text[start:start + size]
+
+
+def create_backend(name: str) -> ParserBackend:
+    if name == OllamaBackend.name:
+        return OllamaBackend()
+    if name == StandInBackend.name:
+        seed = os.environ.get("NOTES_STANDIN_SEED")
+        return StandInBackend(
+            latency_ms=float(os.environ.get("NOTES_STANDIN_LATENCY_MS", "800")),
+            latency_sigma=float(os.environ.get("NOTES_STANDIN_LATENCY_SIGMA", "0.5")),
+            error_rate=float(os.environ.get("NOTES_STANDIN_ERROR_RATE", "0")),
+            seed=int(seed) if seed else None,
+        )
+    raise ValueError(f"Unknown parser backend: {name}")
+
+
+backend = create_backend(os.environ.get("NOTES_LLM_BACKEND", OllamaBackend.name))
+
+
+# -------------------------
+# Parse cache
+# -------------------------
+# Any change to the prompt, NoteActionList schema or backend (model,
+# temperature) changes the parse version, which invalidates previously
+# cached parses.
+def parse_version(parser_backend: ParserBackend) -> str:
+    return hashlib.sha256(
+        json.dumps(
+            [
+                system_instructions,
+                parser_backend.identity(),
+                NoteActionList.model_json_schema(),
+                KEY_FORMAT,
+            ],
+            sort_keys=True,
+        ).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+parse_cache = ParseCache(
+    version=parse_version(backend),
+    max_entries=int(os.environ.get("PARSE_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.environ.get("PARSE_CACHE_TTL", str(7 * 24 * 3600))),
+    # Set PARSE_CACHE_DB="" to keep the cache in memory only.
+    db_path=os.environ.get(
+        "PARSE_CACHE_DB", os.path.join(BASE_DIR, "parse_cache.db")
+    ) or None,
+    max_db_entries=int(os.environ.get("PARSE_CACHE_DB_SIZE", "100000")),
 )
 
-structured_model = model.with_structured_output(NoteAction)
-chain = prompt | structured_model
 
+def warm_backend_in_background() -> threading.Thread:
+    """
+    Warm the parser backend on a daemon thread so the first NL request
+    does not pay for it. Startup itself is not delayed.
+    """
+    thread = threading.Thread(
+        target=backend.warm, name="llm-warmup", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def set_backend(parser_backend: ParserBackend):
+    """
+    Swap the parser backend at runtime (benchmarks, tests). The parse cache
+    switches to the new backend's version so parses never leak between
+    backends.
+    """
+    global backend
+    backend = parser_backend
+    parse_cache.set_version(parse_version(parser_backend))
+
+
+def is_cacheable(actions: List[NoteAction]) -> bool:
+    """
+    Normalization folds case and whitespace, so only actions that do not
+    carry user-authored text to store (new_topic / new_message) may be
+    shared between inputs with the same normalized form. Search and target
+    text may: lookups ignore case.
+    """
+    return all(a.new_topic is None and a.new_message is None for a in actions)
+
+
+# -------------------------
+# Admission control
+# -------------------------
+# Every backend call (invoke, or a whole stream) holds one of
+# NOTES_LLM_MAX_CONCURRENT slots. Up to NOTES_LLM_MAX_QUEUE more wait
+# for one, each for at most NOTES_LLM_QUEUE_TIMEOUT seconds (well under
+# the Streamlit client's 60s timeout); beyond that callers get
+# admission.Overloaded. Rules, cache hits and coalesced waiters never
+# take a slot.
+
+llm_slots = AdmissionLimiter(
+    "llm",
+    max_concurrent=int(os.environ.get("NOTES_LLM_MAX_CONCURRENT", "2")),
+    max_queue=int(os.environ.get("NOTES_LLM_MAX_QUEUE", "16")),
+    queue_timeout=float(os.environ.get("NOTES_LLM_QUEUE_TIMEOUT", "20")),
+)
+
+
+def invoke_admitted(user_input: str) -> List[NoteAction]:
+    with llm_slots.slot():
+        return backend.invoke(user_input).actions
+
+
+async def ainvoke_admitted(user_input: str) -> List[NoteAction]:
+    async with llm_slots.aslot():
+        return (await backend.ainvoke(user_input)).actions
+
+
+# -------------------------
+# In-flight coalescing
+# -------------------------
+# A double-clicked "Send to AI", or the same popular phrasing arriving on
+# several threads at once, would otherwise start one LLM call each. Calls
+# are keyed on the normalized input, like the parse cache; a waiter whose
+# raw text differs from the leader's only takes the leader's actions when
+# they could have come from the cache (see is_cacheable), and otherwise
+# makes its own call. Keys keep punctuation, so such a waiter differs from
+# the leader only in case and whitespace ("C#" never waits on "C++").
+
+inflight_parses = SingleFlight()
+
+COALESCED = metrics.REGISTRY.register(metrics.Counter(
+    "notes_llm_coalesced_total",
+    "Parses that waited for an identical in-flight LLM call, by whether "
+    "they used its result (shared) or had to call the LLM anyway (fallback).",
+    ("outcome",),
+))
+
+
+def invoke_coalesced(user_input: str, cache_key: str) -> List[NoteAction]:
+    """
+    invoke_admitted(user_input), sharing the call with concurrent
+    requests for the same cache_key.
+    """
+    call, leader = inflight_parses.join(cache_key, user_input)
+    if leader:
+        try:
+            actions = invoke_admitted(user_input)
+        except Exception as e:
+            inflight_parses.fail(cache_key, call, e)
+            raise
+        inflight_parses.finish(cache_key, call, actions)
+        return actions
+
+    call.wait()
+    actions = _leader_actions(call, user_input)
+    return actions if actions is not None else invoke_admitted(user_input)
+
+
+async def ainvoke_coalesced(user_input: str, cache_key: str) -> List[NoteAction]:
+    """
+    invoke_coalesced for the async server. Sync and async callers share
+    in-flight calls.
+    """
+    call, leader = inflight_parses.join(cache_key, user_input)
+    if leader:
+        try:
+            actions = await ainvoke_admitted(user_input)
+        except asyncio.CancelledError:
+            # The client went away; waiters make their own call.
+            inflight_parses.finish(cache_key, call, None)
+            raise
+        except Exception as e:
+            inflight_parses.fail(cache_key, call, e)
+            raise
+        inflight_parses.finish(cache_key, call, actions)
+        return actions
+
+    await call.wait_async()
+    actions = _leader_actions(call, user_input)
+    return actions if actions is not None else await ainvoke_admitted(user_input)
+
+
+def _stream_admitted(user_input: str):
+    """
+    Stream a parse under an LLM slot: yields ("token", chunk) items and
+    returns the parsed actions.
+    """
+    parts = []
+    with llm_slots.slot():
+        for chunk in backend.stream(user_input):
+            parts.append(chunk)
+            yield "token", chunk
+    return NoteActionList.model_validate_json("".join(parts)).actions
+
+
+def _stream_coalesced(user_input: str, cache_key: str):
+    """
+    _stream_admitted for stream_user_query_with_source, sharing the call
+    with concurrent requests for the same cache_key (streamed or not).
+    Only the leader yields tokens; waiters just get the actions.
+    """
+    call, leader = inflight_parses.join(cache_key, user_input)
+    if leader:
+        try:
+            actions = yield from _stream_admitted(user_input)
+        except GeneratorExit:
+            # The client went away; waiters make their own call.
+            inflight_parses.finish(cache_key, call, None)
+            raise
+        except Exception as e:
+            inflight_parses.fail(cache_key, call, e)
+            raise
+        inflight_parses.finish(cache_key, call, actions)
+        return actions
+
+    call.wait()
+    actions = _leader_actions(call, user_input)
+    if actions is None:
+        actions = yield from _stream_admitted(user_input)
+    return actions
+
+
+def _leader_actions(call, user_input: str) -> Optional[List[NoteAction]]:
+    """
+    The finished leader call's actions for a waiter with user_input
+    (re-raising its error), or None if the waiter must call the LLM itself
+    (including when the leader was cancelled and has no result).
+    """
+    # Both inputs have the same key, so they differ at most in case and
+    # whitespace, which is_cacheable allows for.
+    same_text = call.context == user_input
+    if call.error is not None:
+        if same_text:
+            COALESCED.inc(outcome="shared")
+            raise call.error
+    elif call.result is not None and (same_text or is_cacheable(call.result)):
+        COALESCED.inc(outcome="shared")
+        return [action.model_copy() for action in call.result]
+    COALESCED.inc(outcome="fallback")
+    return None
+
+
+# -------------------------
+# Deterministic fast path
+# -------------------------
+# Each rule is a full-match regex plus a builder that turns the match into a
+# NoteAction. Only inputs that match a rule end to end are handled here;
+# anything else (extra clauses, ambiguous phrasing) goes to the LLM.
+# The first group of rules mirrors the sentences frontend/streamlit_app.py
+# generates for the manual Create/Update/Delete tabs.
+
+PARSE_SOURCE_RULES = "rules"
+PARSE_SOURCE_CACHE = "cache"
+PARSE_SOURCE_LLM = "llm"
+
+_NOTES = r"(?:all\s+)?(?:of\s+)?(?:my\s+|the\s+)?notes"
+_A_NOTE = r"(?:a\s+|an\s+|the\s+|my\s+)?(?:new\s+)?note"
+_MY_NOTE = r"(?:my\s+|the\s+)?note"
+
+_POLITE_TAIL = re.compile(
+    r"\b(?:please|pls|plz|thanks|thank\s+you|thx)$", re.IGNORECASE
+)
+
+
+def _lookup_text(text: str) -> Optional[str]:
+    """
+    A topic or search capture without trailing sentence punctuation, or
+    None when it carries more than the topic ("the exam, please") and is
+    left to the LLM.
+    """
+    text = text.rstrip(".!?").rstrip()
+    if not text or "," in text or _POLITE_TAIL.search(text):
+        return None
+    return text
+
+
+def _by_lookup(action: str, field: str, group: str):
+    def build(m):
+        value = _lookup_text(m[group])
+        if value is None:
+            return None
+        return NoteAction(action=action, **{field: value})
+    return build
+
+
+_FAST_RULES = [
+    # "Change the topic of note 7 to X with message Y"
+    (
+        r"change\s+the\s+topic\s+of\s+note\s+#?(?P<id>\d+)\s+to\s+(?P<topic>.+?)"
+        r"\s+with\s+message\s+(?P<message>.+)",
+        lambda m: NoteAction(
+            action="update",
+            note_id=int(m["id"]),
+            new_topic=m["topic"],
+            new_message=m["message"],
+        ),
+    ),
+    # "Change the topic of note 7 to X"
+    (
+        r"change\s+the\s+topic\s+of\s+note\s+#?(?P<id>\d+)\s+to\s+(?P<topic>.+)",
+        lambda m: NoteAction(
+            action="update", note_id=int(m["id"]), new_topic=m["topic"]
+        ),
+    ),
+    # "Update note 7 and say Y"
+    (
+        r"(?:update|edit|change)\s+note\s+#?(?P<id>\d+)\s+(?:and\s+)?"
+        r"(?:say|says|to\s+say)\s+(?P<message>.+)",
+        lambda m: NoteAction(
+            action="update", note_id=int(m["id"]), new_message=m["message"]
+        ),
+    ),
+    # "Create a note about X that says Y"
+    (
+        rf"(?:create|add|write|make)\s+{_A_NOTE}\s+(?:about|on|titled|called)\s+"
+        r"(?P<topic>.+?)\s+(?:that|which)\s+says\s+(?P<message>.+)",
+        lambda m: NoteAction(
+            action="create", new_topic=m["topic"], new_message=m["message"]
+        ),
+    ),
+    # "Delete note 7"
+    (
+        rf"(?:delete|remove)\s+{_MY_NOTE}\s+(?:id\s+)?#?(?P<id>\d+)",
+        lambda m: NoteAction(action="delete", note_id=int(m["id"])),
+    ),
+    # "Delete my note about databases"
+    (
+        rf"(?:delete|remove)\s+{_MY_NOTE}\s+(?:about|on|titled|called)\s+(?P<topic>.+)",
+        _by_lookup("delete", "target_topic", "topic"),
+    ),
+    # "Show note 7"
+    (
+        rf"(?:show|read|get|open|display|view)\s+(?:me\s+)?{_MY_NOTE}\s+"
+        r"(?:id\s+)?#?(?P<id>\d+)",
+        lambda m: NoteAction(action="read", note_id=int(m["id"])),
+    ),
+    # "Show my notes about databases"
+    (
+        rf"(?:show|read|get|find|display|view)\s+(?:me\s+)?(?:{_NOTES}|{_MY_NOTE})\s+"
+        r"(?:about|on|titled|called)\s+(?P<topic>.+)",
+        _by_lookup("read", "target_topic", "topic"),
+    ),
+    # "Search my notes for exam"
+    (
+        rf"(?:search|find)\s+(?:in\s+)?(?:{_NOTES}\s+)?(?:for\s+)(?P<query>.+)",
+        _by_lookup("read", "search_query", "query"),
+    ),
+    # "Show all my notes", "list notes", "my notes"
+    (
+        rf"(?:(?:show|list|get|display|view|see)\s+(?:me\s+)?)?{_NOTES}",
+        lambda m: NoteAction(action="list"),
+    ),
+    # "help", "what can you do"
+    (
+        r"help(?:\s+me)?|what\s+can\s+(?:you|i)\s+do|how\s+does\s+this\s+work"
+        r"|how\s+do\s+i\s+use\s+this",
+        lambda m: NoteAction(action="help"),
+    ),
+]
+
+# Compound requests ("... and delete note 3") are left to the LLM.
+_COMPOUND = re.compile(
+    r"\b(?:and|then|also)\s+(?:then\s+)?(?:create|add|write|delete|remove|"
+    r"update|edit|change|rename|show|list|read|find|search)\b",
+    re.IGNORECASE,
+)
+
+_COMPILED_RULES = [
+    (re.compile(pattern, re.IGNORECASE | re.DOTALL), build)
+    for pattern, build in _FAST_RULES
+]
+
+
+def fast_parse(user_input: str) -> Optional[NoteAction]:
+    """
+    Try to turn user_input into a NoteAction without calling the LLM.
+    Returns None when no rule matches the whole input, or the matching
+    rule leaves it to the LLM.
+    """
+    text = user_input.strip()
+    if not text or _COMPOUND.search(text):
+        return None
+
+    # Retry without trailing punctuation ("Show all my notes.") only after
+    # the exact text failed, so message bodies keep their punctuation.
+    for candidate in (text, text.rstrip(".!?").rstrip()):
+        for pattern, build in _COMPILED_RULES:
+            match = pattern.fullmatch(candidate)
+            if match:
+                return build(match)
+    return None
+
+
+def parse_user_query_with_source(user_input: str) -> Tuple[List[NoteAction], str]:
+    """
+    Parse user_input, trying the deterministic rules first, then the parse
+    cache, and only then the LLM.
+    Returns (actions, source) where source is "rules", "cache" or "llm".
+    """
+    action = fast_parse(user_input)
+    if action is not None:
+        return [action], PARSE_SOURCE_RULES
+
+    cache_key = normalize_query(user_input)
+    cached = parse_cache.get(cache_key)
+    if cached is not None:
+        return NoteActionList.model_validate(cached).actions, PARSE_SOURCE_CACHE
+
+    actions = invoke_coalesced(user_input, cache_key)
+    if is_cacheable(actions):
+        parse_cache.set(cache_key, NoteActionList(actions=actions).model_dump())
+    return actions, PARSE_SOURCE_LLM
+
+
+async def aparse_user_query_with_source(
+    user_input: str,
+) -> Tuple[List[NoteAction], str]:
+    """
+    parse_user_query_with_source for the async server: the LLM call is
+    awaited and parse cache I/O runs on a worker thread.
+    """
+    action = fast_parse(user_input)
+    if action is not None:
+        return [action], PARSE_SOURCE_RULES
+
+    cache_key = normalize_query(user_input)
+    cached = await asyncio.to_thread(parse_cache.get, cache_key)
+    if cached is not None:
+        return NoteActionList.model_validate(cached).actions, PARSE_SOURCE_CACHE
+
+    actions = await ainvoke_coalesced(user_input, cache_key)
+    if is_cacheable(actions):
+        await asyncio.to_thread(
+            parse_cache.set, cache_key, NoteActionList(actions=actions).model_dump()
+        )
+    return actions, PARSE_SOURCE_LLM
+
+
+def parse_user_query(user_input: str) -> List[NoteAction]:
+    return parse_user_query_with_source(user_input)[0]
+
+
+def stream_user_query_with_source(user_input: str) -> Iterator[Tuple[str, object]]:
+    """
+    Streaming variant of parse_user_query_with_source. Yields
+      ("token", text)              for each chunk the LLM generates
+      ("actions", (actions, source)) once, as the last item
+    Rules and cache hits, and requests that join an identical parse already
+    being streamed for someone else, yield only the final "actions" item.
+    """
+    action = fast_parse(user_input)
+    if action is not None:
+        yield "actions", ([action], PARSE_SOURCE_RULES)
+        return
+
+    cache_key = normalize_query(user_input)
+    cached = parse_cache.get(cache_key)
+    if cached is not None:
+        yield "actions", (
+            NoteActionList.model_validate(cached).actions,
+            PARSE_SOURCE_CACHE,
+        )
+        return
 
-def parse_user_query(user_input: str) -> NoteAction:
-    return chain.invoke({"user_input": user_input})
+    actions = yield from _stream_coalesced(user_input, cache_key)
+    if is_cacheable(actions):
+        parse_cache.set(cache_key, NoteActionList(actions=actions).model_dump())
+    yield "actions", (actions, PARSE_SOURCE_LLM)
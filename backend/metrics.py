@@ -0,0 +1,259 @@
+"""
+Request timing and Prometheus metrics for the Flask app.
+
+Handlers wrap their work in `phase("parse")`, `phase("db")`, ... and the
+app's after_request hook turns the recorded phases into a Server-Timing
+header and into the histograms below, which /api/metrics serves in the
+Prometheus text exposition format. Phases nest: time spent in an inner
+phase (e.g. "commit" inside "db") is not counted again in the outer one.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + inner + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, **extra) -> str:
+        return _format_labels(dict(zip(self.labelnames, key), **extra))
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}",
+                 f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> list:
+        return [f"{self.name}{self._labels(key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels):
+        """
+        Mirror a total that is counted elsewhere (e.g. cache hit counts).
+        """
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_value(self, key, value) -> list:
+        counts, total, count = value
+        lines = [
+            f"{self.name}_bucket{self._labels(key, le=bound)} {n}"
+            for bound, n in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_bucket{self._labels(key, le='+Inf')} {count}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+        lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics served by /api/metrics, plus collector callbacks that
+    refresh gauges (e.g. cache sizes) right before each scrape.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            collect()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "notes_http_requests_total",
+    "HTTP requests handled, by endpoint, note action and status code.",
+    ("endpoint", "action", "status"),
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "notes_http_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ("endpoint", "action"),
+))
+PARSES = REGISTRY.register(Counter(
+    "notes_nl_parses_total",
+    "Natural-language requests parsed, by parse source (rules, cache, llm).",
+    ("source",),
+))
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    "notes_request_phase_duration_seconds",
+    "Time spent per request phase (parse, db, commit, serialize).",
+    ("endpoint", "action", "phase"),
+))
+
+
+# ============ Per-request phase timing ============
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a block as request phase `name`. Outside a request this is a no-op
+    timer, so library code can use it unconditionally.
+    """
+    if not has_request_context():
+        yield
+        return
+
+    stack = g.setdefault("phase_stack", [])
+    frame = [0.0]  # time spent in nested phases
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        timings = g.setdefault("phase_timings", {})
+        timings[name] = timings.get(name, 0.0) + elapsed - frame[0]
+
+
+def note_action(action: str):
+    """
+    Record which NoteAction a request ran, for the `action` label.
+    """
+    if has_request_context():
+        g.setdefault("note_actions", []).append(action or "unknown")
+
+
+def action_label() -> str:
+    actions = g.get("note_actions") or []
+    if not actions:
+        return "none"
+    if len(actions) > 1:
+        return "multi"
+    return actions[0]
+
+
+def start_request(started: float = None):
+    """
+    started: a perf_counter() value if the request began before Flask saw
+    it (the async server parses NL queries first).
+    """
+    g.request_started = started if started is not None else time.perf_counter()
+
+
+def add_phase(name: str, seconds: float):
+    """
+    Record time spent in phase `name` before the request reached Flask.
+    """
+    if has_request_context():
+        timings = g.setdefault("phase_timings", {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def finish_request(response, endpoint: str):
+    """
+    Record the current request's metrics and attach a Server-Timing header
+    (durations in milliseconds) to response.
+    """
+    started = g.get("request_started")
+    if started is None:
+        return response
+
+    total = time.perf_counter() - started
+    action = action_label()
+    timings = g.get("phase_timings", {})
+
+    REQUESTS.inc(endpoint=endpoint, action=action, status=response.status_code)
+    REQUEST_SECONDS.observe(total, endpoint=endpoint, action=action)
+    for name, seconds in timings.items():
+        PHASE_SECONDS.observe(seconds, endpoint=endpoint, action=action, phase=name)
+
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    response.headers["Server-Timing"] = ", ".join(entries)
+    return response
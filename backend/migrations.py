@@ -0,0 +1,174 @@
+"""
+Versioned schema migrations for the SQLite database.
+
+db.create_all() only creates missing tables; it never adds indexes or
+other objects to tables that already exist (like the shipped notes.db).
+Each migration below runs once, in order, and the schema version is kept
+in SQLite's PRAGMA user_version. Statements use IF NOT EXISTS so a
+migration that was interrupted part-way can safely run again.
+
+Run `python migrations.py --check` to print the query plans of the hot
+note queries and fail if any of them regressed to a full scan or sort.
+"""
+import logging
+import sys
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, create_search_index
+
+logger = logging.getLogger(__name__)
+
+
+def _add_notes_listing_index(connection):
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_notes_user_last_update "
+            "ON notes (user_id, last_update DESC, note_id DESC)"
+        )
+    )
+
+
+def _add_notes_search_index(connection):
+    try:
+        create_search_index(connection)
+    except OperationalError as e:
+        # SQLite without FTS5: search falls back to LIKE (see models.py).
+        logger.warning("Skipping full-text index: %s", e)
+
+
+def _add_users_notes_version(connection):
+    # Fresh databases already have the column from db.create_all().
+    columns = {c["name"] for c in inspect(connection).get_columns("users")}
+    if "notes_version" not in columns:
+        connection.execute(
+            text(
+                "ALTER TABLE users "
+                "ADD COLUMN notes_version INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+
+
+# (version, description, upgrade function taking a Connection)
+MIGRATIONS = [
+    (1, "index notes by (user_id, last_update, note_id)", _add_notes_listing_index),
+    (2, "full-text index over notes", _add_notes_search_index),
+    (3, "per-user notes version for ETags", _add_users_notes_version),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def run_migrations(engine=None):
+    """
+    Apply every migration newer than the database's user_version.
+    Returns the list of versions that were applied.
+    """
+    engine = engine or db.engine
+    with engine.connect() as connection:
+        current = schema_version(connection)
+
+    applied = []
+    for version, description, upgrade in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("Applying migration %d: %s", version, description)
+        with engine.begin() as connection:
+            upgrade(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+        applied.append(version)
+    return applied
+
+
+# ============ Query plan checks ============
+
+def explain_query_plan(query):
+    """
+    Return the EXPLAIN QUERY PLAN detail lines for a SQLAlchemy ORM query.
+    """
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = compiled.construct_params()
+    positional = tuple(params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + str(compiled), positional
+    )
+    return [row[3] for row in rows]
+
+
+def plan_problems(plan_lines):
+    """
+    Plan lines that mean the notes table is scanned or sorted in full.
+    """
+    return [
+        line
+        for line in plan_lines
+        if line.startswith("SCAN notes ")
+        or line == "SCAN notes"
+        or "USE TEMP B-TREE" in line
+    ]
+
+
+def hot_note_queries():
+    """
+    The listing queries every note view runs, built the same way app.py
+    builds them. Imported lazily because app.py imports this module.
+    """
+    from app import encode_cursor, keyset_page_query
+    from models import Note
+
+    base = Note.query.filter_by(user_id=1)
+    cursor = encode_cursor(Note(note_id=1, last_update=datetime.utcnow()))
+    return {
+        "list first page": keyset_page_query(base, limit=50),
+        "list next page": keyset_page_query(base, limit=50, cursor=cursor),
+    }
+
+
+def query_plans():
+    """
+    Returns {query name: EXPLAIN QUERY PLAN lines} for hot_note_queries().
+    """
+    return {
+        name: explain_query_plan(query)
+        for name, query in hot_note_queries().items()
+    }
+
+
+def check_query_plans(plans=None):
+    """
+    Returns {query name: [problem plan lines]} for hot queries that no
+    longer use the listing index. plans defaults to query_plans().
+    """
+    if plans is None:
+        plans = query_plans()
+    problems = {}
+    for name, plan in plans.items():
+        bad = plan_problems(plan)
+        if bad:
+            problems[name] = bad
+    return problems
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        if "--check" in sys.argv:
+            plans = query_plans()
+            for name, plan in plans.items():
+                print(f"{name}:")
+                for line in plan:
+                    print(f"    {line}")
+            failed = check_query_plans(plans)
+            if failed:
+                print(f"Full scan or sort in: {', '.join(failed)}")
+                sys.exit(1)
+        else:
+            with db.engine.connect() as connection:
+                print(f"Schema version: {schema_version(connection)}")
@@ -0,0 +1,194 @@
+"""
+Keep the Ollama model resident and report how often parses hit a cold
+model.
+
+Ollama unloads a model after it has been idle for its keep-alive period,
+and the next request then waits for the model to load again (seconds for
+llama3). ModelLifecycle:
+
+- warm():   loads the model ahead of the first parse (an empty generate
+            request loads it without producing output)
+- keep-alive is sent with every request, so the model stays loaded that
+  long after the last one
+- a probe thread asks Ollama every probe_interval seconds which models
+  are loaded (`ollama ps`) and reloads ours if it was evicted
+- record(): classifies each parse as cold or warm from the
+  load_duration Ollama reports with the response
+
+The ollama client is imported on first use, like LangChain in llm_agent.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INFERENCES = metrics.REGISTRY.register(metrics.Counter(
+    "notes_llm_inferences_total",
+    "Parses run on the LLM, by whether the model had to be loaded first.",
+    ("model", "start"),
+))
+LOAD_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "notes_llm_model_load_duration_seconds",
+    "Model load time Ollama reported for cold parses and warm-ups.",
+    ("model",),
+))
+MODEL_LOADED = metrics.REGISTRY.register(metrics.Gauge(
+    "notes_llm_model_loaded",
+    "1 if the last health probe found the model loaded in Ollama.",
+    ("model",),
+))
+SERVER_UP = metrics.REGISTRY.register(metrics.Gauge(
+    "notes_llm_server_up",
+    "1 if the last health probe reached the Ollama server.",
+    ("model",),
+))
+WARMUPS = metrics.REGISTRY.register(metrics.Counter(
+    "notes_llm_warmups_total",
+    "Model warm-up requests sent to Ollama, by outcome.",
+    ("model", "outcome"),
+))
+
+
+class ModelLifecycle:
+    def __init__(self, model_name: str, keep_alive: str = "30m",
+                 probe_interval: float = 60.0, cold_load_seconds: float = 0.5):
+        self.model_name = model_name
+        self.keep_alive = keep_alive
+        self.probe_interval = probe_interval
+        # Ollama reports a few ms of load_duration even for a loaded model;
+        # anything above this counts as a cold start.
+        self.cold_load_seconds = cold_load_seconds
+
+        self._client = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._probe_thread = None
+        self._status = {
+            "server_up": None,
+            "model_loaded": None,
+            "last_probe": None,
+            "last_warmup": None,
+            "last_error": None,
+            "cold_inferences": 0,
+            "warm_inferences": 0,
+        }
+
+    # ---------- Ollama calls ----------
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                import ollama
+
+                self._client = ollama.Client()
+            return self._client
+
+    def warm(self) -> bool:
+        """
+        Load the model now. Returns False (and logs) if Ollama is not
+        reachable; parses will then load it on demand as before.
+        """
+        try:
+            response = self._get_client().generate(
+                model=self.model_name, prompt="", keep_alive=self.keep_alive
+            )
+        except Exception as e:
+            WARMUPS.inc(model=self.model_name, outcome="error")
+            self._update(last_error=str(e), server_up=False)
+            logger.warning("Warming %s failed: %s", self.model_name, e)
+            return False
+
+        load = (response.load_duration or 0) / 1e9
+        LOAD_SECONDS.observe(load, model=self.model_name)
+        WARMUPS.inc(model=self.model_name, outcome="ok")
+        self._update(last_warmup=time.time(), server_up=True, model_loaded=True)
+        logger.info("Warmed %s in %.2fs", self.model_name, load)
+        return True
+
+    def probe(self) -> bool:
+        """
+        Ask Ollama which models are loaded; reload ours if it is not.
+        Returns whether the model is loaded after the probe.
+        """
+        try:
+            running = self._get_client().ps().models
+        except Exception as e:
+            self._update(last_probe=time.time(), last_error=str(e),
+                         server_up=False, model_loaded=False)
+            SERVER_UP.set(0, model=self.model_name)
+            MODEL_LOADED.set(0, model=self.model_name)
+            return False
+
+        loaded = any(self._is_ours(m.model or m.name or "") for m in running)
+        self._update(last_probe=time.time(), server_up=True, model_loaded=loaded)
+        SERVER_UP.set(1, model=self.model_name)
+        if not loaded:
+            logger.info("%s is not loaded; warming it again", self.model_name)
+            loaded = self.warm()
+        MODEL_LOADED.set(1 if loaded else 0, model=self.model_name)
+        return loaded
+
+    def _is_ours(self, name: str) -> bool:
+        # "llama3" is reported as "llama3:latest".
+        if ":" in self.model_name:
+            return name == self.model_name
+        return name.split(":", 1)[0] == self.model_name
+
+    # ---------- probe thread ----------
+
+    def start(self):
+        """
+        Warm the model and start the probe thread (if probe_interval > 0).
+        Safe to call more than once.
+        """
+        self.warm()
+        with self._lock:
+            if self.probe_interval <= 0 or self._probe_thread is not None:
+                return
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop, name="llm-probe", daemon=True
+            )
+            self._probe_thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            self.probe()
+
+    # ---------- per-parse accounting ----------
+
+    def record(self, response_metadata: Optional[dict]):
+        """
+        Count one parse as cold or warm from the load_duration (ns) in the
+        response metadata LangChain passes through from Ollama.
+        """
+        load_ns = (response_metadata or {}).get("load_duration")
+        if load_ns is None:
+            return
+        load = load_ns / 1e9
+        cold = load > self.cold_load_seconds
+        INFERENCES.inc(model=self.model_name, start="cold" if cold else "warm")
+        if cold:
+            LOAD_SECONDS.observe(load, model=self.model_name)
+        with self._lock:
+            self._status["cold_inferences" if cold else "warm_inferences"] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            status = dict(self._status)
+        status.update(
+            model=self.model_name,
+            keep_alive=self.keep_alive,
+            probe_interval=self.probe_interval,
+        )
+        return status
+
+    def _update(self, **fields):
+        with self._lock:
+            self._status.update(fields)
@@ -1,9 +1,42 @@
-from flask_sqlalchemy import SQLAlchemy
+import re
 from datetime import datetime
 
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import column, event, func, inspect, literal_column, table, text
+
 db = SQLAlchemy()
 
 
+def configure_sqlite(engine, pragmas: dict):
+    """
+    Run `PRAGMA name = value` for each entry of pragmas on every new DBAPI
+    connection the engine opens, so pooled connections are all tuned alike.
+    """
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+def begin_write_transaction():
+    """
+    Make sure the session's connection is inside a real SQLite transaction,
+    taking the write lock up front (BEGIN IMMEDIATE, which waits up to
+    busy_timeout). pysqlite only opens transactions lazily before DML, and a
+    SAVEPOINT issued outside one would commit on RELEASE; opening the
+    transaction first lets session.begin_nested() nest as expected.
+
+    Every other writer waits until this transaction ends, so call it only
+    after slow work such as LLM parses is done.
+    """
+    connection = db.session.connection()
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
 class User(db.Model):
     __tablename__ = "users"
 
@@ -11,6 +44,10 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
     last_login = db.Column(db.DateTime, nullable=True)
+    # Bumped on every note create/update/delete; /api/notes derives its
+    # ETag from it so unchanged listings can be answered with 304.
+    notes_version = db.Column(
+        db.Integer, nullable=False, default=0, server_default="0")
 
     notes = db.relationship("Note", backref="user", lazy=True)
 
@@ -35,11 +72,139 @@ class Note(db.Model):
     last_update = db.Column(
         db.DateTime, default=datetime.utcnow, nullable=False)
 
-    def to_dict(self):
-        return {
-            "note_id": self.note_id,
-            "user_id": self.user_id,
-            "topic": self.topic,
-            "message": self.message,
-            "last_update": self.last_update.isoformat(),
-        }
+    # Matches the listing order (user_id filter, newest first, note_id as
+    # tie-breaker) so listings and keyset pages are index range scans with
+    # no sort step. Existing databases get it from migrations.py.
+    __table_args__ = (
+        db.Index(
+            "ix_notes_user_last_update",
+            "user_id",
+            last_update.desc(),
+            note_id.desc(),
+        ),
+    )
+
+    # Every field to_dict() can return, in output order.
+    FIELDS = ("note_id", "user_id", "topic", "message", "last_update")
+
+    def to_dict(self, fields=None):
+        """
+        fields limits the output to those keys, so a note loaded with only
+        some columns (see app.project_notes) is not lazily loaded in full.
+        """
+        data = {name: getattr(self, name) for name in fields or self.FIELDS}
+        if "last_update" in data:
+            data["last_update"] = data["last_update"].isoformat()
+        return data
+
+
+def bump_notes_version(user_id: int):
+    """
+    Increment the user's notes_version in the current transaction, so it
+    commits (or rolls back) together with the note change.
+    """
+    db.session.execute(
+        db.update(User)
+        .where(User.user_id == user_id)
+        .values(notes_version=User.notes_version + 1)
+    )
+
+
+def get_notes_version(user_id: int):
+    """
+    The user's current notes_version, or None if the user does not exist.
+    """
+    return db.session.execute(
+        db.select(User.notes_version).where(User.user_id == user_id)
+    ).scalar()
+
+
+# ============ Full-text search (SQLite FTS5) ============
+# notes_fts is an external-content FTS5 table over notes.topic/notes.message.
+# Triggers keep it in sync on every insert/update/delete of a note, so the
+# application code never writes to it directly.
+
+notes_fts = table("notes_fts", column("rowid"), column("topic"), column("message"))
+
+NOTES_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        topic, message,
+        content='notes', content_rowid='note_id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, topic, message)
+        VALUES (new.note_id, new.topic, new.message);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, topic, message)
+        VALUES ('delete', old.note_id, old.topic, old.message);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, topic, message)
+        VALUES ('delete', old.note_id, old.topic, old.message);
+        INSERT INTO notes_fts(rowid, topic, message)
+        VALUES (new.note_id, new.topic, new.message);
+    END
+    """,
+]
+
+fts_enabled = False
+
+
+def create_search_index(connection):
+    """
+    Create the FTS5 index and its triggers, backfilling it from existing
+    notes when the table is new. Run by migrations.py; raises
+    OperationalError if SQLite was built without FTS5.
+    """
+    existed = inspect(connection).has_table("notes_fts")
+    for statement in NOTES_FTS_DDL:
+        connection.execute(text(statement))
+    if not existed:
+        connection.execute(
+            text("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')"))
+
+
+def detect_search_index():
+    """
+    Set fts_enabled according to whether notes_fts exists, so callers can
+    fall back to LIKE search when it does not.
+    """
+    global fts_enabled
+    fts_enabled = inspect(db.engine).has_table("notes_fts")
+
+
+def fts_match_expression(search_query: str):
+    """
+    Turn free text into an FTS5 MATCH expression: every word must appear,
+    each matched as a prefix ("assign" finds "assignments").
+    Returns None if the text has no searchable words.
+    """
+    terms = re.findall(r"\w+", search_query)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def apply_fts_search(query, match_expression: str):
+    """
+    Restrict a Note query to notes matching match_expression, ranked by BM25
+    (topic hits weigh twice as much as message hits). Rows come back as
+    (Note, snippet) where snippet highlights the matches with <mark>.
+    """
+    fts = literal_column("notes_fts")
+    snippet = func.snippet(fts, -1, "<mark>", "</mark>", "…", 16)
+    return (
+        query.join(notes_fts, notes_fts.c.rowid == Note.note_id)
+        .filter(fts.op("MATCH")(match_expression))
+        .add_columns(snippet.label("snippet"))
+        .order_by(func.bm25(fts, 2.0, 1.0))
+    )
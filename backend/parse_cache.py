@@ -0,0 +1,194 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+# Bumped whenever normalize_query changes, so keys made the old way are
+# not served (it is part of the parse cache version).
+KEY_FORMAT = 2
+
+
+def normalize_query(text: str) -> str:
+    """
+    Fold case and whitespace so that "Show all my notes" and "show all my
+    notes" share a cache key. Punctuation is kept: cached actions carry the
+    user's words (search_query, target_topic), and "C#" and "C++" must not
+    share them.
+    """
+    return " ".join(text.casefold().split())
+
+
+class ParseCache:
+    """
+    Two-tier cache of parsed NoteAction results keyed on the normalized
+    user input.
+
+    - memory: an in-process LRU (OrderedDict) bounded by max_entries
+    - disk:   an optional SQLite table bounded by max_db_entries, so entries
+              survive restarts
+
+    Entries expire after ttl_seconds. Every entry is stamped with `version`
+    (a hash of the prompt/model config); entries from another version are
+    treated as misses and purged when the cache opens.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        max_entries: int = 1024,
+        ttl_seconds: float = 7 * 24 * 3600,
+        db_path: Optional[str] = None,
+        max_db_entries: int = 100_000,
+    ):
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+
+        self._memory = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS parse_cache (
+                    key TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    last_hit REAL NOT NULL
+                )
+                """
+            )
+            # Prompt or model changed since the last run: drop old parses.
+            self._conn.execute(
+                "DELETE FROM parse_cache WHERE version != ?", (version,)
+            )
+            self._conn.commit()
+
+    # ---------- public API ----------
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, stored_at FROM parse_cache "
+                    "WHERE key = ? AND version = ?",
+                    (key, self.version),
+                ).fetchone()
+                if row is not None:
+                    value, stored_at = json.loads(row[0]), row[1]
+                    if now - stored_at <= self.ttl_seconds:
+                        self._conn.execute(
+                            "UPDATE parse_cache SET last_hit = ? WHERE key = ?",
+                            (now, key),
+                        )
+                        self._conn.commit()
+                        self._remember(key, stored_at, value)
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._conn.execute(
+                        "DELETE FROM parse_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self._stats["stores"] += 1
+
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO parse_cache "
+                    "(key, version, value, stored_at, last_hit) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, self.version, json.dumps(value), now, now),
+                )
+                self._writes_since_trim += 1
+                if self._writes_since_trim >= 100:
+                    self._trim_disk(now)
+                self._conn.commit()
+
+    def set_version(self, version: str):
+        """
+        Switch to another prompt/model version. In-memory entries are
+        dropped; disk entries of other versions are kept but never served.
+        """
+        with self._lock:
+            self.version = version
+            self._memory.clear()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM parse_cache")
+                self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            if self._conn is not None:
+                stats["disk_entries"] = self._conn.execute(
+                    "SELECT COUNT(*) FROM parse_cache"
+                ).fetchone()[0]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        )
+        stats["version"] = self.version
+        return stats
+
+    # ---------- internals (caller holds the lock) ----------
+
+    def _remember(self, key: str, stored_at: float, value: dict):
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _trim_disk(self, now: float):
+        self._writes_since_trim = 0
+        self._conn.execute(
+            "DELETE FROM parse_cache WHERE stored_at < ?",
+            (now - self.ttl_seconds,),
+        )
+        cursor = self._conn.execute(
+            """
+            DELETE FROM parse_cache WHERE key IN (
+                SELECT key FROM parse_cache
+                ORDER BY last_hit DESC
+                LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_db_entries,),
+        )
+        self._stats["evictions"] += max(cursor.rowcount, 0)
@@ -0,0 +1,140 @@
+"""
+Password hashing off the request threads.
+
+Werkzeug's scrypt/pbkdf2 hashes are deliberately slow (hundreds of ms of
+CPU each). Run inline, a burst of logins holds the GIL and every request
+thread waits for it, so note endpoints stall too. Hashes and checks here
+run in a small process pool instead, and at most PASSWORD_HASH_MAX_PENDING
+of them may be queued or running at once; beyond that callers get
+HashingBusy, which the auth endpoints turn into 503 + Retry-After.
+
+Configuration (environment):
+
+- PASSWORD_HASH_METHOD:      Werkzeug method string, e.g. "scrypt",
+                             "scrypt:16384:8:1" or "pbkdf2:sha256:600000"
+- PASSWORD_HASH_WORKERS:     pool processes (0 = hash on the calling thread)
+- PASSWORD_HASH_MAX_PENDING: hashes queued or running before rejecting
+- PASSWORD_HASH_WAIT_SECONDS: how long a caller waits for a free slot
+
+Stored hashes carry the method they were made with, so when the method
+changes, needs_rehash() tells login to re-hash the password it just
+verified.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import metrics
+from metrics import phase
+
+HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+HASH_WORKERS = int(
+    os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+MAX_PENDING = int(
+    os.environ.get("PASSWORD_HASH_MAX_PENDING", str(max(1, HASH_WORKERS) * 4))
+)
+WAIT_SECONDS = float(os.environ.get("PASSWORD_HASH_WAIT_SECONDS", "2"))
+
+HASH_SECONDS = metrics.REGISTRY.register(metrics.Histogram(
+    "notes_password_hash_duration_seconds",
+    "Time spent hashing or checking passwords, including queueing.",
+    ("op",),
+))
+HASH_REJECTED = metrics.REGISTRY.register(metrics.Counter(
+    "notes_password_hash_rejected_total",
+    "Password hashes refused because too many were already pending.",
+    ("op",),
+))
+REHASHES = metrics.REGISTRY.register(metrics.Counter(
+    "notes_password_rehashes_total",
+    "Stored password hashes upgraded to the configured method at login.",
+))
+
+
+class HashingBusy(Exception):
+    """
+    Raised when PASSWORD_HASH_MAX_PENDING hashes are already in flight.
+    """
+
+    retry_after = 1
+
+
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver (where available): workers are forked from a
+            # clean single-threaded server, not from this process and its
+            # request, probe and autosave threads (forking those can
+            # deadlock on inherited locks). Workers still import the
+            # script the server was started with; app.py skips its
+            # start-up work there (HASH_WORKER).
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else None
+            )
+            _pool = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS, mp_context=context
+            )
+        return _pool
+
+
+def _run(op: str, fn, *args):
+    if not _slots.acquire(timeout=WAIT_SECONDS):
+        HASH_REJECTED.inc(op=op)
+        raise HashingBusy(f"too many password {op} operations in progress")
+    start = time.perf_counter()
+    try:
+        with phase("hash"):
+            if HASH_WORKERS <= 0:
+                return fn(*args)
+            return _get_pool().submit(fn, *args).result()
+    finally:
+        _slots.release()
+        HASH_SECONDS.observe(time.perf_counter() - start, op=op)
+
+
+def hash_password(password: str) -> str:
+    return _run("hash", generate_password_hash, password, HASH_METHOD)
+
+
+def verify_password(pwhash: str, password: str) -> bool:
+    return _run("verify", check_password_hash, pwhash, password)
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method: str) -> str:
+    # "scrypt" is stored as "scrypt:32768:8:1"; hash once to learn the
+    # full parameter string Werkzeug writes for this method.
+    return generate_password_hash("", method, salt_length=1).split("$", 1)[0]
+
+
+def needs_rehash(pwhash: str) -> bool:
+    """
+    True if pwhash was made with a method or cost other than HASH_METHOD.
+    """
+    return pwhash.split("$", 1)[0] != _method_prefix(HASH_METHOD)
+
+
+def upgrade_hash(pwhash: str, password: str) -> Optional[str]:
+    """
+    After password has been verified against pwhash, return a new hash
+    made with HASH_METHOD if pwhash is outdated, else None.
+    """
+    if not needs_rehash(pwhash):
+        return None
+    REHASHES.inc()
+    return hash_password(password)
+
@@ -0,0 +1,397 @@
+"""
+Vector index over note text for similarity search.
+
+Each user's notes are embedded into rows of a float32 NumPy matrix
+(unit-length vectors), so a search is one matrix-vector product per user
+plus a partial sort for the top k. Several queries can be searched at
+once as one matrix-matrix product.
+
+Embedders are pluggable (NOTES_EMBEDDER):
+
+- "hashing" (default): feature hashing of words and character trigrams.
+  No model download, no network; finds notes that share words or word
+  fragments ("assignments" ~ "assignment"), not synonyms.
+- "sentence-transformers[:model]": a local sentence-transformers model
+  (default all-MiniLM-L6-v2) for real semantic matches ("ML homework" ~
+  "transformers assignment"). Needs the optional sentence-transformers
+  package.
+
+The index follows writes incrementally (see app.py), and each user's
+entry remembers the notes_version it reflects; a user whose notes changed
+some other way (bulk import, another process) is re-embedded on their
+next search. The matrices are saved to an .npz file so a restart only
+re-embeds users whose notes changed meanwhile.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------
+# Embedders
+# -------------------------
+
+class Embedder:
+    name = "base"
+    dim = 0
+
+    def identity(self) -> str:
+        """
+        Everything that affects the vectors; persisted indexes built with
+        a different identity are discarded.
+        """
+        return f"{self.name}:{self.dim}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        (len(texts), dim) float32 matrix of L2-normalized rows.
+        """
+        raise NotImplementedError
+
+
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are about as at be by for from in is it my me note notes of on "
+    "or that the this to was what with".split()
+)
+
+
+class HashingEmbedder(Embedder):
+    """
+    Words and the character trigrams of each word ("<ho", "hom", ...,
+    "rk>") are hashed into dim buckets with a +/-1 sign; counts are
+    log-scaled and rows normalized. crc32 keeps the hashing stable across
+    processes, which persisted vectors rely on.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 256, trigram_weight: float = 0.5):
+        self.dim = dim
+        self.trigram_weight = trigram_weight
+        self._features = {}  # word -> (buckets, weights), bounded below
+
+    def identity(self) -> str:
+        return f"{self.name}:{self.dim}:{self.trigram_weight}"
+
+    def _word_features(self, word: str) -> Tuple[List[int], List[float]]:
+        cached = self._features.get(word)
+        if cached is not None:
+            return cached
+        grams = [word] + [
+            f"<{word}>"[i:i + 3] for i in range(len(word))
+        ]
+        buckets, weights = [], []
+        for n, gram in enumerate(grams):
+            h = zlib.crc32(gram.encode("utf-8"))
+            buckets.append(h % self.dim)
+            weight = 1.0 if n == 0 else self.trigram_weight
+            weights.append(weight if h & 0x80000000 else -weight)
+        if len(self._features) > 200_000:
+            self._features.clear()
+        self._features[word] = (buckets, weights)
+        return buckets, weights
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        rows, cols, vals = [], [], []
+        for row, text in enumerate(texts):
+            for word in _WORD.findall(text.casefold()):
+                if word in _STOPWORDS:
+                    continue
+                buckets, weights = self._word_features(word)
+                rows.extend([row] * len(buckets))
+                cols.extend(buckets)
+                vals.extend(weights)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (rows, cols), vals)
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        return _normalize(matrix)
+
+
+class SentenceTransformerEmbedder(Embedder):
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        # Optional dependency, imported only when selected.
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def identity(self) -> str:
+        return f"{self.name}:{self.model_name}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, batch_size=64, convert_to_numpy=True)
+        return _normalize(vectors.astype(np.float32))
+
+
+def create_embedder(spec: str) -> Embedder:
+    name, _, arg = spec.partition(":")
+    if name == HashingEmbedder.name:
+        return HashingEmbedder(dim=int(arg) if arg else 256)
+    if name == SentenceTransformerEmbedder.name:
+        return SentenceTransformerEmbedder(arg or "all-MiniLM-L6-v2")
+    raise ValueError(f"Unknown embedder: {spec}")
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def note_text(topic: str, message: str, max_chars: int = 2000) -> str:
+    # The topic is repeated so it weighs more than an equally long message.
+    return f"{topic}\n{topic}\n{(message or '')[:max_chars]}"
+
+
+# -------------------------
+# Index
+# -------------------------
+
+class _UserVectors:
+    """
+    One user's vectors: rows [0, size) of `vectors` are live, `ids[i]` is
+    the note_id of row i. Capacity grows by doubling; deletes move the last
+    row into the hole.
+    """
+
+    def __init__(self, dim: int, version: Optional[int] = None,
+                 ids: Optional[np.ndarray] = None,
+                 vectors: Optional[np.ndarray] = None):
+        self.version = version
+        if ids is None:
+            ids = np.zeros(0, dtype=np.int64)
+            vectors = np.zeros((0, dim), dtype=np.float32)
+        self.size = len(ids)
+        self.ids = ids
+        self.vectors = vectors
+        self.rows = {int(note_id): i for i, note_id in enumerate(ids)}
+
+    def upsert(self, note_id: int, vector: np.ndarray):
+        row = self.rows.get(note_id)
+        if row is None:
+            if self.size == len(self.ids):
+                capacity = max(16, 2 * self.size)
+                self.ids = np.resize(self.ids, capacity)
+                vectors = np.zeros((capacity, self.vectors.shape[1]), np.float32)
+                vectors[:self.size] = self.vectors[:self.size]
+                self.vectors = vectors
+            row = self.size
+            self.size += 1
+            self.rows[note_id] = row
+            self.ids[row] = note_id
+        self.vectors[row] = vector
+
+    def delete(self, note_id: int):
+        row = self.rows.pop(note_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            moved = int(self.ids[last])
+            self.ids[row] = moved
+            self.vectors[row] = self.vectors[last]
+            self.rows[moved] = row
+        self.size -= 1
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        if self.size == 0:
+            return [[] for _ in range(len(queries))]
+        scores = queries @ self.vectors[:self.size].T  # (queries, notes)
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for q, candidates in enumerate(top):
+            order = candidates[np.argsort(-scores[q, candidates])]
+            results.append(
+                [(int(self.ids[i]), float(scores[q, i])) for i in order]
+            )
+        return results
+
+
+class SemanticIndex:
+    def __init__(self, embedder: Embedder, path: Optional[str] = None,
+                 source: Optional[str] = None):
+        """
+        source names what the index reflects (app.py passes the database
+        path); a saved index from another source is discarded on load.
+        """
+        self.embedder = embedder
+        self.path = path
+        self.source = source
+        self._users: Dict[int, _UserVectors] = {}
+        self._lock = threading.RLock()
+        self._dirty = False
+        if path:
+            self._load()
+
+    # ---------- building ----------
+
+    def rebuild_user(self, user_id: int, version: int,
+                     notes: Iterable[Tuple[int, str, str]], batch_size: int = 2000):
+        """
+        Replace a user's vectors with embeddings of notes, an iterable of
+        (note_id, topic, message), reflecting notes_version `version`.
+        """
+        entry = _UserVectors(self.embedder.dim, version)
+        batch = []
+
+        def flush():
+            vectors = self.embedder.embed([note_text(t, m) for _, t, m in batch])
+            for (note_id, _, _), vector in zip(batch, vectors):
+                entry.upsert(note_id, vector)
+            batch.clear()
+
+        for note in notes:
+            batch.append(note)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        with self._lock:
+            self._users[user_id] = entry
+            self._dirty = True
+
+    def version(self, user_id: int) -> Optional[int]:
+        with self._lock:
+            entry = self._users.get(user_id)
+            return entry.version if entry else None
+
+    # ---------- incremental updates ----------
+
+    def apply(self, changes: List[tuple]):
+        """
+        Apply committed changes: ("upsert", user_id, note_id, topic,
+        message) or ("delete", user_id, note_id). Each change is one
+        notes_version bump. Users not loaded yet are skipped; they are
+        built from the database on their first search.
+        """
+        upserts = [c for c in changes if c[0] == "upsert"]
+        vectors = (
+            self.embedder.embed([note_text(c[3], c[4]) for c in upserts])
+            if upserts else []
+        )
+        vector_for = {id(c): v for c, v in zip(upserts, vectors)}
+
+        with self._lock:
+            for change in changes:
+                entry = self._users.get(change[1])
+                if entry is None:
+                    continue
+                if change[0] == "upsert":
+                    entry.upsert(change[2], vector_for[id(change)])
+                else:
+                    entry.delete(change[2])
+                entry.version += 1
+            self._dirty = True
+
+    # ---------- search ----------
+
+    def search(self, user_id: int, queries: List[str],
+               k: int = 10) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k (note_id, cosine similarity) lists, one per query, best first.
+        """
+        query_vectors = self.embedder.embed(queries)
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return [[] for _ in queries]
+            return entry.search(query_vectors, k)
+
+    # ---------- persistence ----------
+
+    def start_autosave(self, interval: float):
+        """
+        Save every `interval` seconds (if anything changed) on a daemon
+        thread, and once more at interpreter exit.
+        """
+        if not self.path:
+            return
+        atexit.register(self.save)
+        if interval <= 0:
+            return
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.save()
+                except OSError as e:
+                    logger.warning("Saving semantic index failed: %s", e)
+
+        stop = threading.Event()
+        threading.Thread(target=loop, name="semantic-autosave", daemon=True).start()
+
+    def save(self):
+        """
+        Write the index to self.path (atomically, via a temp file).
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            arrays, versions = {}, {}
+            for user_id, entry in self._users.items():
+                arrays[f"ids_{user_id}"] = entry.ids[:entry.size].copy()
+                arrays[f"vectors_{user_id}"] = entry.vectors[:entry.size].copy()
+                versions[str(user_id)] = entry.version
+            self._dirty = False
+        meta = {
+            "embedder": self.embedder.identity(),
+            "source": self.source,
+            "versions": versions,
+        }
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), np.uint8)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npz.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+                if meta["embedder"] != self.embedder.identity():
+                    logger.info("Semantic index built with %s; rebuilding",
+                                meta["embedder"])
+                    return
+                if meta.get("source") != self.source:
+                    logger.info("Semantic index %s belongs to %s; rebuilding",
+                                self.path, meta.get("source"))
+                    return
+                for user_id, version in meta["versions"].items():
+                    self._users[int(user_id)] = _UserVectors(
+                        self.embedder.dim,
+                        version,
+                        data[f"ids_{user_id}"],
+                        data[f"vectors_{user_id}"],
+                    )
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning("Ignoring unreadable semantic index %s: %s",
+                           self.path, e)
+            self._users = {}
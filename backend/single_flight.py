@@ -0,0 +1,94 @@
+"""
+Coalescing of identical concurrent calls ("single flight").
+
+The first caller for a key becomes the leader and runs the call; callers
+that arrive with the same key while it is running wait for the leader's
+outcome instead of starting their own. Nothing is kept once the call
+finishes: this removes duplicate in-flight work, the parse cache handles
+repeats over time.
+"""
+import asyncio
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+
+class Call:
+    """
+    One in-flight call. `context` is whatever the leader passed to join()
+    (e.g. its raw input), so waiters can decide whether the outcome
+    applies to them.
+    """
+
+    def __init__(self, context: Any):
+        self.context = context
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._futures = []  # (loop, future) of coroutines in wait_async()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    async def wait_async(self):
+        """
+        wait() for coroutines, without blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._done.is_set():
+                return
+            future = loop.create_future()
+            self._futures.append((loop, future))
+        await future
+
+    def _set_done(self):
+        with self._lock:
+            self._done.set()
+            futures, self._futures = self._futures, []
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Call] = {}
+
+    def join(self, key: str, context: Any = None) -> Tuple[Call, bool]:
+        """
+        Returns (call, is_leader). The leader must finish the call with
+        finish() or fail(); everyone else calls call.wait() (or
+        call.wait_async() on an event loop).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                return call, False
+            call = self._calls[key] = Call(context)
+            return call, True
+
+    def finish(self, key: str, call: Call, result):
+        call.result = result
+        self._release(key, call)
+
+    def fail(self, key: str, call: Call, error: BaseException):
+        call.error = error
+        self._release(key, call)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def _release(self, key: str, call: Call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call._set_done()
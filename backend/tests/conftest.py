@@ -0,0 +1,23 @@
+"""
+The tests import the backend modules directly, like the benchmark
+scripts, against a throwaway database: app.py opens NOTES_DB_PATH when it
+is first imported, so it is set here, before any test imports it.
+"""
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TESTS_DIR)
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ["NOTES_DB_PATH"] = os.path.join(
+    tempfile.mkdtemp(prefix="notes-test-"), "notes.db"
+)
+os.environ["NOTES_SEMANTIC_INDEX_PATH"] = ""
+os.environ["PARSE_CACHE_DB"] = ""
+os.environ["NOTES_LLM_BACKEND"] = "standin"
+os.environ["NOTES_LLM_WARMUP"] = "0"
+os.environ["PASSWORD_HASH_WORKERS"] = "0"
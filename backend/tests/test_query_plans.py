@@ -0,0 +1,18 @@
+from app import app
+from migrations import (
+    LATEST_VERSION, hot_note_queries, plan_problems, query_plans,
+    run_migrations, schema_version,
+)
+from models import db
+
+
+def test_hot_note_queries_use_the_listing_index():
+    with app.app_context():
+        run_migrations()
+        with db.engine.connect() as connection:
+            assert schema_version(connection) == LATEST_VERSION
+
+        plans = query_plans()
+        assert set(plans) == set(hot_note_queries())
+        for name, plan in plans.items():
+            assert plan_problems(plan) == [], f"{name}: {plan}"
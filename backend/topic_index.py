@@ -0,0 +1,179 @@
+"""
+In-memory trigram index over note topics, for resolving "the note about
+X" in update and delete requests.
+
+Topics are split into words and each word into trigrams the way pg_trgm
+does ("exam" -> "  e", " ex", "exa", "xam", "am "). A query is scored
+against the topics that share at least half of its trigrams:
+
+- 1.0 for an identical topic,
+- otherwise the Dice coefficient of the two trigram sets, raised to at
+  least 0.5 + 0.5 * len(query) / len(topic) when the query is a substring
+  of the topic (what the old ILIKE '%query%' matched).
+
+Each result also says whether it is such a literal match: "exact" or
+"contains", compared case-insensitively on the topic as written
+(punctuation kept, so "C#" does not match "C++", apart from a trailing
+"." "!" or "?"), or None for a fuzzy
+match that only shares trigrams.
+
+Like the semantic index, each user's entry remembers the notes_version
+it reflects; app.py applies committed writes to it and rebuilds a user
+whose version no longer matches.
+"""
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# (note_id, score, "exact" | "contains" | None)
+Match = Tuple[int, float, Optional[str]]
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize_topic(topic: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", topic.casefold()).split())
+
+
+def fold_topic(topic: str) -> str:
+    """
+    Case and whitespace folded, punctuation kept except at the end of the
+    sentence ("groceries." folds like "groceries"): the text literal
+    matches are checked against.
+    """
+    return " ".join(topic.casefold().split()).rstrip(".!?").rstrip()
+
+
+def trigrams(text: str) -> Set[str]:
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class _UserTopics:
+    def __init__(self, version: int):
+        self.version = version
+        self.topics: Dict[int, str] = {}         # note_id -> normalized topic
+        self.folded: Dict[int, str] = {}         # note_id -> fold_topic(topic)
+        self.grams: Dict[int, Set[str]] = {}     # note_id -> its trigrams
+        self.postings: Dict[str, Set[int]] = {}  # trigram -> note_ids
+
+    def upsert(self, note_id: int, topic: str):
+        self.delete(note_id)
+        normalized = normalize_topic(topic)
+        grams = trigrams(normalized)
+        self.topics[note_id] = normalized
+        self.folded[note_id] = fold_topic(topic)
+        self.grams[note_id] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(note_id)
+
+    def delete(self, note_id: int):
+        self.topics.pop(note_id, None)
+        self.folded.pop(note_id, None)
+        for gram in self.grams.pop(note_id, ()):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(note_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def rank(self, query: str, limit: int) -> List[Match]:
+        normalized = normalize_topic(query)
+        folded = fold_topic(query)
+        query_grams = trigrams(normalized)
+        if not query_grams:
+            return []
+
+        # Only topics sharing at least half of the query's trigrams are
+        # scored. Any such topic contains one of the rarest
+        # len - ceil(len / 2) + 1 trigrams, so candidates come from those
+        # short posting lists and common trigrams ("  t", "ing") are
+        # never walked.
+        by_rarity = sorted(
+            query_grams, key=lambda g: len(self.postings.get(g, ()))
+        )
+        rare = by_rarity[:len(by_rarity) - (len(by_rarity) + 1) // 2 + 1]
+        candidates = set()
+        for gram in rare:
+            candidates.update(self.postings.get(gram, ()))
+
+        scored = []
+        for note_id in candidates:
+            topic = self.topics[note_id]
+            if topic == normalized:
+                score = 1.0
+            else:
+                shared = len(query_grams & self.grams[note_id])
+                score = 2.0 * shared / (len(query_grams) + len(self.grams[note_id]))
+                if normalized in topic:
+                    score = max(score, 0.5 + 0.5 * len(normalized) / len(topic))
+            scored.append((score, note_id))
+        # Best score first; ties go to the newest note (highest id).
+        scored.sort(reverse=True)
+        return [
+            (note_id, score, self._literal(folded, note_id))
+            for score, note_id in scored[:limit]
+        ]
+
+    def _literal(self, folded_query: str, note_id: int) -> Optional[str]:
+        topic = self.folded[note_id]
+        if topic == folded_query:
+            return "exact"
+        if folded_query and folded_query in topic:
+            return "contains"
+        return None
+
+
+class TopicIndex:
+    def __init__(self):
+        self._users: Dict[int, _UserTopics] = {}
+        self._lock = threading.Lock()
+
+    def version(self, user_id: int) -> Optional[int]:
+        with self._lock:
+            entry = self._users.get(user_id)
+            return entry.version if entry else None
+
+    def rebuild_user(self, user_id: int, version: int,
+                     topics: Iterable[Tuple[int, str]]):
+        """
+        Replace a user's entry with topics, (note_id, topic) pairs,
+        reflecting notes_version `version`.
+        """
+        entry = _UserTopics(version)
+        for note_id, topic in topics:
+            entry.upsert(note_id, topic)
+        with self._lock:
+            self._users[user_id] = entry
+
+    def apply(self, changes: List[tuple]):
+        """
+        Apply committed changes in the format SemanticIndex.apply takes:
+        ("upsert", user_id, note_id, topic, message) or
+        ("delete", user_id, note_id).
+        """
+        with self._lock:
+            for change in changes:
+                entry = self._users.get(change[1])
+                if entry is None:
+                    continue
+                if change[0] == "upsert":
+                    entry.upsert(change[2], change[3])
+                else:
+                    entry.delete(change[2])
+                entry.version += 1
+
+    def resolve(self, user_id: int, query: str,
+                limit: int = 5) -> List[Match]:
+        """
+        Up to limit (note_id, score, literal) matches for query, best
+        first.
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return []
+            return entry.rank(query, limit)
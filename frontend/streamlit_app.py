@@ -1,12 +1,30 @@
 import base64
+import json
 import requests
 import streamlit as st
 
 BACKEND_URL = "http://localhost:5000"  # Flask backend URL
 
 
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    One requests.Session shared by every rerun and browser session, so
+    calls to the backend reuse pooled keep-alive connections instead of
+    opening a new TCP connection each time.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+http = get_http_session()
+
+
 def register_user(username: str, password: str):
-    resp = requests.post(
+    resp = http.post(
         f"{BACKEND_URL}/api/register",
         json={"username": username, "password": password},
         timeout=10,
@@ -15,7 +33,7 @@ def register_user(username: str, password: str):
 
 
 def login_user(username: str, password: str):
-    resp = requests.post(
+    resp = http.post(
         f"{BACKEND_URL}/api/login",
         json={"username": username, "password": password},
         timeout=10,
@@ -24,7 +42,7 @@ def login_user(username: str, password: str):
 
 
 def forgot_password(username: str, new_password: str):
-    resp = requests.post(
+    resp = http.post(
         f"{BACKEND_URL}/api/forgot_password",
         json={"username": username, "new_password": new_password},
         timeout=10,
@@ -32,24 +50,138 @@ def forgot_password(username: str, new_password: str):
     return resp.json(), resp.status_code
 
 
-def send_nl_query(user_id: int, query: str):
-    resp = requests.post(
-        f"{BACKEND_URL}/api/nl_query",
+def stream_nl_query(user_id: int, query: str):
+    """
+    Yields (event, data) pairs from the backend's Server-Sent Events
+    stream: parse_started, token, parsed_action, result, done or error.
+    """
+    with http.post(
+        f"{BACKEND_URL}/api/nl_query/stream",
         json={"user_id": user_id, "query": query},
-        timeout=60,
+        stream=True,
+        timeout=(10, 60),
+    ) as resp:
+        if resp.status_code != 200:
+            yield "error", resp.json()
+            return
+
+        event = "message"
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):])
+
+
+def create_note(user_id: int, topic: str, message: str):
+    resp = http.post(
+        f"{BACKEND_URL}/api/notes",
+        json={"user_id": user_id, "topic": topic, "message": message},
+        timeout=10,
     )
     return resp.json(), resp.status_code
 
 
-def fetch_notes(user_id: int):
-    resp = requests.get(
-        f"{BACKEND_URL}/api/notes",
+def update_note(user_id: int, note_id: int, topic: str = None, message: str = None):
+    resp = http.patch(
+        f"{BACKEND_URL}/api/notes/{note_id}",
+        json={"user_id": user_id, "topic": topic, "message": message},
+        timeout=10,
+    )
+    return resp.json(), resp.status_code
+
+
+def delete_note(user_id: int, note_id: int):
+    resp = http.delete(
+        f"{BACKEND_URL}/api/notes/{note_id}",
         params={"user_id": user_id},
         timeout=10,
     )
     return resp.json(), resp.status_code
 
 
+NOTES_PAGE_SIZE = 20
+# The Update/Delete pickers only show ids and topics, not message bodies,
+# so they page through many more notes than the Your Notes column.
+NOTE_PICKER_FIELDS = "note_id,topic"
+NOTE_PICKER_PAGE_SIZE = 500
+
+
+def fetch_notes_page(user_id: int, limit: int = NOTES_PAGE_SIZE, cursor: str = None,
+                     fields: str = None):
+    """
+    GET one page of notes; fields (e.g. "note_id,topic") asks the backend
+    for only those note fields. The last payload for each request is kept
+    in session state with its ETag; when the backend answers 304 the
+    cached payload is reused and no note data is transferred.
+    """
+    params = {"user_id": user_id, "limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    if fields:
+        params["fields"] = fields
+
+    cache = st.session_state.setdefault("notes_etag_cache", {})
+    cache_key = (user_id, limit, cursor, fields)
+    headers = {}
+    if cache_key in cache:
+        headers["If-None-Match"] = cache[cache_key][0]
+
+    resp = http.get(
+        f"{BACKEND_URL}/api/notes",
+        params=params,
+        headers=headers,
+        timeout=10,
+    )
+    if resp.status_code == 304:
+        return cache[cache_key][1], 200
+
+    data = resp.json()
+    if resp.status_code == 200 and resp.headers.get("ETag"):
+        cache[cache_key] = (resp.headers["ETag"], data)
+    return data, resp.status_code
+
+
+# Notes fetched during this rerun, keyed by (user_id, max_notes, fields).
+# Streamlit runs the script from the top on every rerun, so this starts
+# empty each time; the Update and Delete pickers share one fetch.
+_notes_cache = {}
+
+
+def invalidate_notes():
+    """
+    Forget notes fetched during this rerun. Call after any change to the
+    user's notes so the widgets rendered afterwards show it.
+    """
+    _notes_cache.clear()
+
+
+def fetch_notes(user_id: int, max_notes: int = NOTES_PAGE_SIZE, fields: str = None):
+    """
+    Fetch up to max_notes of the newest notes by following the backend's
+    pagination cursors. The returned payload keeps the last next_cursor so
+    callers can tell whether more notes exist.
+    """
+    key = (user_id, max_notes, fields)
+    if key not in _notes_cache:
+        _notes_cache[key] = _fetch_notes(user_id, max_notes, fields)
+    return _notes_cache[key]
+
+
+def _fetch_notes(user_id: int, max_notes: int, fields: str):
+    notes, cursor = [], None
+    while True:
+        data, status = fetch_notes_page(
+            user_id, limit=max_notes - len(notes), cursor=cursor, fields=fields
+        )
+        if status != 200:
+            return data, status
+        notes.extend(data.get("notes", []))
+        cursor = data.get("next_cursor")
+        if not cursor or len(notes) >= max_notes:
+            return {"notes": notes, "next_cursor": cursor}, status
+
+
 # -------- Streamlit App Config --------
 st.set_page_config(page_title="AI Notepad", page_icon="📝", layout="wide")
 
@@ -102,6 +234,18 @@ st.markdown(
         color: #333;
     }
 
+    .note-snippet {
+        margin-top: 0.2rem;
+        font-size: 0.85rem;
+        color: #355070;
+    }
+
+    .note-snippet mark {
+        background-color: var(--soft-blue);
+        padding: 0 0.1rem;
+        border-radius: 0.2rem;
+    }
+
     /* Buttons */
     .stButton>button {
         border-radius: 999px;
@@ -167,14 +311,22 @@ st.markdown(
 # ---------- Session state ----------
 if "user" not in st.session_state:
     st.session_state.user = None
+if "notes_shown" not in st.session_state:
+    st.session_state.notes_shown = NOTES_PAGE_SIZE
+if "picker_notes_shown" not in st.session_state:
+    st.session_state.picker_notes_shown = NOTE_PICKER_PAGE_SIZE
 
 
 # ---------- Helper: render a single note ----------
 def render_single_note(note: dict):
+    snippet_html = ""
+    if note.get("snippet"):
+        snippet_html = f'<div class="note-snippet">🔎 {note["snippet"]}</div>'
     st.markdown(
         f"""
         <div class="note-card">
             <div class="note-topic">🗂 {note.get("topic", "")}</div>
+            {snippet_html}
             <div class="note-message">{note.get("message", "")}</div>
             <div class="note-meta">
                 ID: {note.get("note_id")} · Last update: {note.get("last_update")}
@@ -185,7 +337,52 @@ def render_single_note(note: dict):
     )
 
 
+# ---------- Helper: pick one of the user's notes ----------
+def note_picker(user_id: int, label: str, key: str):
+    """
+    A selectbox over the user's newest notes (ids and topics), with its
+    own "Load more" paging. Returns the selected note_id, or None if the
+    user has no notes.
+    """
+    data, _ = fetch_notes(
+        user_id, st.session_state.picker_notes_shown, fields=NOTE_PICKER_FIELDS)
+    notes = data.get("notes", [])
+    if not notes:
+        return None
+    note_map = {f"#{n['note_id']} - {n['topic']}": n["note_id"] for n in notes}
+    selected_label = st.selectbox(label, list(note_map.keys()), key=key)
+    if data.get("next_cursor") and st.button(
+            "Load more notes", key=f"{key}_more"):
+        st.session_state.picker_notes_shown += NOTE_PICKER_PAGE_SIZE
+        st.rerun()
+    return note_map[selected_label]
+
+
+# ---------- Helper: render the result of an AI request ----------
+def render_nl_result(result: dict):
+    if "error" in result:
+        st.error(result["error"])
+    elif "note" in result:
+        note = result["note"]
+        st.success(result.get("message", "Success"))
+        render_single_note(note)
+    elif "notes" in result:
+        notes = result["notes"]
+        if not notes:
+            st.info(result.get("message", "No notes found."))
+        else:
+            if "message" in result:
+                st.success(result["message"])
+            for n in notes:
+                render_single_note(n)
+    elif "message" in result:
+        st.success(result["message"])
+    else:
+        st.info("No result returned.")
+
+
 # ---------- Helper: hero image as base64 ----------
+@st.cache_data
 def get_hero_image_html(path: str = "hero_notes.png", width: int = 480) -> str:
     try:
         with open(path, "rb") as f:
@@ -274,6 +471,9 @@ with st.sidebar:
         st.write(f"**Logged in as:** {st.session_state.user['username']}")
         if st.button("Logout"):
             st.session_state.user = None
+            st.session_state.notes_shown = NOTES_PAGE_SIZE
+            st.session_state.picker_notes_shown = NOTE_PICKER_PAGE_SIZE
+            st.session_state.notes_etag_cache = {}
             st.success("Logged out.")
 
 
@@ -357,38 +557,47 @@ else:
             if not query.strip():
                 st.warning("Please enter a message.")
             else:
-                ai_loading_placeholder.markdown(
-                    '<div class="ai-loading">🤖 Thinking about your request...</div>',
-                    unsafe_allow_html=True,
-                )
-                with st.spinner("Talking to your AI assistant..."):
-                    data, status = send_nl_query(user_id, query)
-                ai_loading_placeholder.empty()
+                tokens_placeholder = st.empty()
+                tokens = ""
+                result, results, error = None, [], None
+
+                for event, payload in stream_nl_query(user_id, query):
+                    if event == "parse_started":
+                        ai_loading_placeholder.markdown(
+                            '<div class="ai-loading">🤖 Thinking about your request...</div>',
+                            unsafe_allow_html=True,
+                        )
+                    elif event == "token":
+                        tokens += payload["text"]
+                        tokens_placeholder.code(tokens, language="json")
+                    elif event == "parsed_action":
+                        action = ", ".join(
+                            a["action"] for a in payload["parsed_actions"])
+                        ai_loading_placeholder.markdown(
+                            f'<div class="ai-loading">⚙️ Running "{action}" on your notes...</div>',
+                            unsafe_allow_html=True,
+                        )
+                    elif event == "result":
+                        result = payload["result"]
+                        results = payload.get("results", [])
+                        invalidate_notes()
+                    elif event == "error":
+                        error = payload.get("error", "Something went wrong.")
 
-                if status != 200:
-                    st.error(data.get("error", "Something went wrong."))
+                ai_loading_placeholder.empty()
+                tokens_placeholder.empty()
+
+                if error:
+                    st.error(error)
+                elif result is not None:
+                    render_nl_result(result)
+                    # Several actions: the summary above, then each result.
+                    if len(results) > 1:
+                        for step, step_result in enumerate(results, start=1):
+                            st.markdown(f"**Step {step}**")
+                            render_nl_result(step_result)
                 else:
-                    result = data.get("result", {})
-
-                    if "error" in result:
-                        st.error(result["error"])
-                    elif "note" in result:
-                        note = result["note"]
-                        st.success(result.get("message", "Success"))
-                        render_single_note(note)
-                    elif "notes" in result:
-                        notes = result["notes"]
-                        if not notes:
-                            st.info(result.get("message", "No notes found."))
-                        else:
-                            if "message" in result:
-                                st.success(result["message"])
-                            for n in notes:
-                                render_single_note(n)
-                    elif "message" in result:
-                        st.success(result["message"])
-                    else:
-                        st.info("No result returned.")
+                    st.error("Something went wrong.")
 
         st.markdown("---")
         st.markdown("### 📊 Manually Edit Your Notes")
@@ -406,36 +615,23 @@ else:
                 if not new_topic or not new_message:
                     st.error("Topic and Message are required.")
                 else:
-                    nl_text = f"Create a note about {new_topic} that says {new_message}"
                     with st.spinner("Creating note... ✏️"):
-                        data, status = send_nl_query(user_id, nl_text)
-                    if status == 200:
-                        result = data.get("result", {})
-                        if "error" in result:
-                            st.error(result["error"])
-                        elif "note" in result:
-                            st.success(result.get("message", "Note created."))
-                            render_single_note(result["note"])
-                        else:
-                            st.info("Note created.")
+                        data, status = create_note(
+                            user_id, new_topic, new_message)
+                    if status == 201:
+                        invalidate_notes()
+                        st.success(data.get("message", "Note created."))
+                        render_single_note(data["note"])
                     else:
                         st.error(data.get("error", "Error creating note."))
 
         # ---- UPDATE ----
         with tab_update:
             st.subheader("✏️ Update Existing Note")
-            note_data, _ = fetch_notes(user_id)
-            notes = note_data.get("notes", [])
-            note_map = {
-                f"#{n['note_id']} - {n['topic']}": n["note_id"] for n in notes
-            }
-
-            if notes:
-                selected_label = st.selectbox(
-                    "Select a note to update:",
-                    list(note_map.keys()),
-                )
-                selected_id = note_map[selected_label]
+            selected_id = note_picker(
+                user_id, "Select a note to update:", key="update_note_id")
+
+            if selected_id is not None:
                 updated_message = st.text_area(
                     "New message (leave blank to keep same):", key="update_message"
                 )
@@ -448,33 +644,18 @@ else:
                         st.error(
                             "Provide at least a new topic or a new message.")
                     else:
-                        if updated_message and updated_topic:
-                            nl_text = (
-                                f"Change the topic of note {selected_id} to "
-                                f"{updated_topic} with message {updated_message}"
-                            )
-                        elif updated_topic:
-                            nl_text = (
-                                f"Change the topic of note {selected_id} to {updated_topic}"
-                            )
-                        else:
-                            nl_text = (
-                                f"Update note {selected_id} and say {updated_message}"
-                            )
-
                         with st.spinner("Updating note... ✏️"):
-                            data, status = send_nl_query(user_id, nl_text)
+                            data, status = update_note(
+                                user_id,
+                                selected_id,
+                                topic=updated_topic or None,
+                                message=updated_message or None,
+                            )
 
                         if status == 200:
-                            result = data.get("result", {})
-                            if "error" in result:
-                                st.error(result["error"])
-                            elif "note" in result:
-                                st.success(result.get(
-                                    "message", "Note updated."))
-                                render_single_note(result["note"])
-                            else:
-                                st.info("Update completed.")
+                            invalidate_notes()
+                            st.success(data.get("message", "Note updated."))
+                            render_single_note(data["note"])
                         else:
                             st.error(data.get("error", "Update failed."))
             else:
@@ -483,32 +664,19 @@ else:
         # ---- DELETE ----
         with tab_delete:
             st.subheader("🗑️ Delete Note")
-            note_data, _ = fetch_notes(user_id)
-            notes = note_data.get("notes", [])
-            note_map = {
-                f"#{n['note_id']} - {n['topic']}": n["note_id"] for n in notes
-            }
-
-            if notes:
-                del_label = st.selectbox(
-                    "Select a note to delete:",
-                    list(note_map.keys()),
-                )
-                del_id = note_map[del_label]
+            del_id = note_picker(
+                user_id, "Select a note to delete:", key="delete_note_id")
 
+            if del_id is not None:
                 if st.button("Delete Note"):
-                    nl_text = f"Delete note {del_id}"
                     with st.spinner("Deleting note... 🗑️"):
-                        data, status = send_nl_query(user_id, nl_text)
+                        data, status = delete_note(user_id, del_id)
                     if status == 200:
-                        result = data.get("result", {})
-                        if "error" in result:
-                            st.error(result["error"])
-                        else:
-                            st.success(result.get("message", "Note deleted."))
-                            if "deleted_note_id" in result:
-                                st.write(
-                                    f"Deleted note ID: {result['deleted_note_id']}")
+                        invalidate_notes()
+                        st.success(data.get("message", "Note deleted."))
+                        if "deleted_note_id" in data:
+                            st.write(
+                                f"Deleted note ID: {data['deleted_note_id']}")
                     else:
                         st.error(data.get("error", "Delete failed."))
             else:
@@ -520,7 +688,7 @@ else:
             '<h3 class="your-notes-header">📚 Your Notes</h3>',
             unsafe_allow_html=True,
         )
-        data, status = fetch_notes(user_id)
+        data, status = fetch_notes(user_id, st.session_state.notes_shown)
         if status == 200:
             notes = data.get("notes", [])
             if not notes:
@@ -528,5 +696,8 @@ else:
             else:
                 for n in notes:
                     render_single_note(n)
+                if data.get("next_cursor") and st.button("Load more"):
+                    st.session_state.notes_shown += NOTES_PAGE_SIZE
+                    st.rerun()
         else:
             st.error(data.get("error", "Could not load notes."))